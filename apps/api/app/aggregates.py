@@ -0,0 +1,172 @@
+import logging
+from collections import defaultdict
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from .catalog import asset_catalog
+from .locks import user_locks
+from .models import PortfolioAggregate, Position, SectorExposure, Trade
+
+
+logger = logging.getLogger(__name__)
+
+COST_TOLERANCE = 0.01
+
+
+def seed_aggregates(db: Session, user_id: int, sector: str) -> tuple[PortfolioAggregate, SectorExposure]:
+    aggregate = db.get(PortfolioAggregate, user_id)
+    query = db.query(SectorExposure).filter(SectorExposure.user_id == user_id)
+    if aggregate is not None:
+        query = query.filter(SectorExposure.sector == sector)
+    exposures = {row.sector: row for row in query}
+    if aggregate is None or sector not in exposures:
+        by_sector: dict[str, list[float]] = defaultdict(list)
+        for position_sector, cost in _held_positions(db, user_id):
+            by_sector[position_sector].append(cost)
+        seeded = []
+        if aggregate is None:
+            aggregate = PortfolioAggregate(
+                user_id=user_id,
+                cost_basis=sum(sum(costs) for costs in by_sector.values()),
+                position_count=sum(len(costs) for costs in by_sector.values()),
+            )
+            seeded.append(aggregate)
+        for missing in ({sector} | set(by_sector) if seeded else {sector}) - set(exposures):
+            costs = by_sector.get(missing, [])
+            exposures[missing] = SectorExposure(user_id=user_id, sector=missing, cost_basis=sum(costs), position_count=len(costs))
+            seeded.append(exposures[missing])
+        db.add_all(seeded)
+        db.flush(seeded)
+    return aggregate, exposures[sector]
+
+
+def adjust_aggregates(db: Session, user_id: int, sector: str, cost_delta: float, position_delta: int):
+    aggregate, exposure = seed_aggregates(db, user_id, sector)
+    aggregate.cost_basis += cost_delta
+    aggregate.position_count += position_delta
+    exposure.cost_basis += cost_delta
+    exposure.position_count += position_delta
+
+
+def _held_positions(db: Session, user_id: int) -> list[tuple[str, float]]:
+    rows = db.query(Position.symbol, Position.quantity, Position.avg_cost).filter(
+        Position.user_id == user_id, Position.quantity > 0
+    )
+    return [(_sector_for(symbol), quantity * avg_cost) for symbol, quantity, avg_cost in rows]
+
+
+def _sector_for(symbol: str) -> str:
+    asset = asset_catalog.get(symbol)
+    return asset.sector if asset else "Unknown"
+
+
+def reconcile_aggregates(db: Session, fix: bool = False) -> list[dict]:
+    expected_totals: dict[int, list] = defaultdict(lambda: [0.0, 0])
+    expected_sectors: dict[tuple[int, str], list] = defaultdict(lambda: [0.0, 0])
+    holdings: dict[tuple[int, str], float] = {}
+    for user_id, symbol, quantity, avg_cost in db.query(
+        Position.user_id, Position.symbol, Position.quantity, Position.avg_cost
+    ).filter(Position.quantity > 0):
+        sector = _sector_for(symbol)
+        cost = quantity * avg_cost
+        expected_totals[user_id][0] += cost
+        expected_totals[user_id][1] += 1
+        expected_sectors[(user_id, sector)][0] += cost
+        expected_sectors[(user_id, sector)][1] += 1
+        holdings[(user_id, symbol)] = quantity
+
+    mismatches = []
+    aggregates = {row.user_id: row for row in db.query(PortfolioAggregate).all()}
+    for user_id in set(expected_totals) | set(aggregates):
+        cost_basis, position_count = expected_totals.get(user_id, (0.0, 0))
+        row = aggregates.get(user_id)
+        if row is None or abs(row.cost_basis - cost_basis) > COST_TOLERANCE or row.position_count != position_count:
+            mismatches.append(
+                {
+                    "kind": "portfolio",
+                    "user_id": user_id,
+                    "expected": {"cost_basis": round(cost_basis, 4), "position_count": position_count},
+                    "actual": None if row is None else {"cost_basis": round(row.cost_basis, 4), "position_count": row.position_count},
+                }
+            )
+
+    exposures = {(row.user_id, row.sector): row for row in db.query(SectorExposure).all()}
+    for key in set(expected_sectors) | set(exposures):
+        cost_basis, position_count = expected_sectors.get(key, (0.0, 0))
+        row = exposures.get(key)
+        if row is None or abs(row.cost_basis - cost_basis) > COST_TOLERANCE or row.position_count != position_count:
+            mismatches.append(
+                {
+                    "kind": "sector",
+                    "user_id": key[0],
+                    "sector": key[1],
+                    "expected": {"cost_basis": round(cost_basis, 4), "position_count": position_count},
+                    "actual": None if row is None else {"cost_basis": round(row.cost_basis, 4), "position_count": row.position_count},
+                }
+            )
+
+    traded = (
+        db.query(
+            Trade.user_id,
+            Trade.symbol,
+            func.sum(case((Trade.side == "buy", Trade.qty), else_=-Trade.qty)),
+        )
+        .group_by(Trade.user_id, Trade.symbol)
+        .all()
+    )
+    net_traded = {(user_id, symbol): net_quantity or 0 for user_id, symbol, net_quantity in traded}
+    for (user_id, symbol) in set(net_traded) | set(holdings):
+        held = holdings.get((user_id, symbol), 0)
+        net_quantity = net_traded.get((user_id, symbol), 0)
+        if abs(net_quantity - held) > 1e-9:
+            mismatches.append(
+                {
+                    "kind": "trades",
+                    "user_id": user_id,
+                    "symbol": symbol,
+                    "expected": {"quantity": held},
+                    "actual": {"net_traded_quantity": net_quantity},
+                }
+            )
+
+    if fix:
+        for user_id in sorted({row["user_id"] for row in mismatches if row["kind"] in {"portfolio", "sector"}}):
+            repair_user_aggregates(db, user_id)
+    return mismatches
+
+
+def repair_user_aggregates(db: Session, user_id: int):
+    with user_locks.hold(user_id):
+        db.rollback()
+        try:
+            if db.get_bind().dialect.name == "sqlite":
+                db.connection().exec_driver_sql("BEGIN IMMEDIATE")
+            aggregate = (
+                db.query(PortfolioAggregate).filter(PortfolioAggregate.user_id == user_id).with_for_update().first()
+            )
+            exposures = {
+                row.sector: row
+                for row in db.query(SectorExposure).filter(SectorExposure.user_id == user_id).with_for_update()
+            }
+            by_sector: dict[str, list[float]] = defaultdict(list)
+            for sector, cost in _held_positions(db, user_id):
+                by_sector[sector].append(cost)
+
+            if aggregate is None:
+                aggregate = PortfolioAggregate(user_id=user_id)
+                db.add(aggregate)
+            aggregate.cost_basis = sum(sum(costs) for costs in by_sector.values())
+            aggregate.position_count = sum(len(costs) for costs in by_sector.values())
+            for sector in set(by_sector) | set(exposures):
+                row = exposures.get(sector)
+                if row is None:
+                    row = SectorExposure(user_id=user_id, sector=sector)
+                    db.add(row)
+                costs = by_sector.get(sector, [])
+                row.cost_basis = sum(costs)
+                row.position_count = len(costs)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
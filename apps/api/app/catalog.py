@@ -0,0 +1,87 @@
+from dataclasses import dataclass
+from threading import Lock
+from time import monotonic
+
+from .config import settings
+from .database import SessionLocal
+from .models import Asset
+
+
+@dataclass(frozen=True)
+class CatalogAsset:
+    symbol: str
+    name: str
+    type: str
+    sector: str
+    risk_class: str
+    is_active: bool
+    base_price: float
+
+
+class AssetCatalog:
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._lock = Lock()
+        self._loaded_at: float | None = None
+        self._by_symbol: dict[str, CatalogAsset] = {}
+        self._active: list[CatalogAsset] = []
+        self._by_type: dict[str, list[CatalogAsset]] = {}
+        self._by_sector: dict[str, list[CatalogAsset]] = {}
+
+    def get(self, symbol: str) -> CatalogAsset | None:
+        self._ensure_loaded()
+        return self._by_symbol.get(symbol)
+
+    def active(self) -> list[CatalogAsset]:
+        self._ensure_loaded()
+        return self._active
+
+    def by_type(self, asset_type: str) -> list[CatalogAsset]:
+        self._ensure_loaded()
+        return self._by_type.get(asset_type, [])
+
+    def by_sector(self, sector: str) -> list[CatalogAsset]:
+        self._ensure_loaded()
+        return self._by_sector.get(sector, [])
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def _ensure_loaded(self):
+        loaded_at = self._loaded_at
+        if loaded_at is not None and monotonic() - loaded_at < self.ttl_seconds:
+            return
+        with self._lock:
+            if self._loaded_at is not None and monotonic() - self._loaded_at < self.ttl_seconds:
+                return
+            with SessionLocal() as db:
+                rows = db.query(Asset).order_by(Asset.symbol.asc()).all()
+                assets = [
+                    CatalogAsset(
+                        symbol=row.symbol,
+                        name=row.name,
+                        type=row.type,
+                        sector=row.sector,
+                        risk_class=row.risk_class,
+                        is_active=row.is_active,
+                        base_price=row.base_price,
+                    )
+                    for row in rows
+                ]
+
+            active = [asset for asset in assets if asset.is_active]
+            by_type: dict[str, list[CatalogAsset]] = {}
+            by_sector: dict[str, list[CatalogAsset]] = {}
+            for asset in active:
+                by_type.setdefault(asset.type, []).append(asset)
+                by_sector.setdefault(asset.sector, []).append(asset)
+
+            self._by_symbol = {asset.symbol: asset for asset in assets}
+            self._active = active
+            self._by_type = by_type
+            self._by_sector = by_sector
+            self._loaded_at = monotonic()
+
+
+asset_catalog = AssetCatalog(settings.asset_catalog_ttl_seconds)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 from pydantic import BaseModel
 
@@ -16,10 +17,55 @@ class Settings(BaseModel):
     trusted_hosts: list[str] = [host.strip() for host in os.getenv("TRUSTED_HOSTS", "localhost,127.0.0.1,testserver").split(",") if host.strip()]
     enable_docs: bool = os.getenv("ENABLE_DOCS", "true").lower() == "true"
     force_https: bool = os.getenv("FORCE_HTTPS", "false").lower() == "true"
+    asset_catalog_ttl_seconds: int = int(os.getenv("ASSET_CATALOG_TTL_SECONDS", "300"))
     price_mode: str = os.getenv("PRICE_MODE", "simulated")  # simulated | finnhub | hybrid
     price_cache_ttl_seconds: int = int(os.getenv("PRICE_CACHE_TTL_SECONDS", "30"))
+    price_refresh_interval_seconds: int = int(os.getenv("PRICE_REFRESH_INTERVAL_SECONDS", "15"))
+    price_max_staleness_seconds: int = int(os.getenv("PRICE_MAX_STALENESS_SECONDS", "120"))
+    quote_cache_backend: str = os.getenv("QUOTE_CACHE_BACKEND", "memory")  # memory | sqlite
+    quote_cache_path: str = os.getenv("QUOTE_CACHE_PATH", os.path.join(tempfile.gettempdir(), "investipet-quotes.db"))
+    quote_cache_max_entries: int = int(os.getenv("QUOTE_CACHE_MAX_ENTRIES", "512"))
+    quote_failure_backoff_seconds: float = float(os.getenv("QUOTE_FAILURE_BACKOFF_SECONDS", "5"))
+    quote_failure_backoff_max_seconds: float = float(os.getenv("QUOTE_FAILURE_BACKOFF_MAX_SECONDS", "300"))
+    price_fetch_concurrency: int = int(os.getenv("PRICE_FETCH_CONCURRENCY", "8"))
+    price_fetch_deadline_seconds: float = float(os.getenv("PRICE_FETCH_DEADLINE_SECONDS", "5"))
+    price_request_budget_seconds: float = float(os.getenv("PRICE_REQUEST_BUDGET_SECONDS", "2.5"))
     finnhub_api_key: str = os.getenv("FINNHUB_API_KEY", "")
     finnhub_base_url: str = os.getenv("FINNHUB_BASE_URL", "https://finnhub.io/api/v1")
+    finnhub_timeout_seconds: float = float(os.getenv("FINNHUB_TIMEOUT_SECONDS", "4"))
+    finnhub_pool_timeout_seconds: float = float(os.getenv("FINNHUB_POOL_TIMEOUT_SECONDS", "1"))
+    finnhub_max_connections: int = int(os.getenv("FINNHUB_MAX_CONNECTIONS", "10"))
+    finnhub_max_keepalive_connections: int = int(os.getenv("FINNHUB_MAX_KEEPALIVE_CONNECTIONS", "10"))
+    finnhub_keepalive_expiry_seconds: float = float(os.getenv("FINNHUB_KEEPALIVE_EXPIRY_SECONDS", "30"))
+    finnhub_breaker_failure_threshold: int = int(os.getenv("FINNHUB_BREAKER_FAILURE_THRESHOLD", "5"))
+    finnhub_breaker_reset_seconds: float = float(os.getenv("FINNHUB_BREAKER_RESET_SECONDS", "30"))
+    finnhub_http2: bool = os.getenv("FINNHUB_HTTP2", "false").lower() == "true"
+
+    aggregate_reconcile_interval_seconds: int = int(os.getenv("AGGREGATE_RECONCILE_INTERVAL_SECONDS", "3600"))
+    aggregate_reconcile_fix: bool = os.getenv("AGGREGATE_RECONCILE_FIX", "false").lower() == "true"
+    portfolio_cache_max_entries: int = int(os.getenv("PORTFOLIO_CACHE_MAX_ENTRIES", "4096"))
+    equity_snapshot_interval_seconds: int = int(os.getenv("EQUITY_SNAPSHOT_INTERVAL_SECONDS", "3600"))
+    equity_snapshot_chunk_size: int = int(os.getenv("EQUITY_SNAPSHOT_CHUNK_SIZE", "500"))
+    order_match_interval_seconds: int = int(os.getenv("ORDER_MATCH_INTERVAL_SECONDS", "15"))
+    max_open_orders_per_user: int = int(os.getenv("MAX_OPEN_ORDERS_PER_USER", "50"))
+    risk_sample_interval_seconds: int = int(os.getenv("RISK_SAMPLE_INTERVAL_SECONDS", "60"))
+    risk_window_samples: int = int(os.getenv("RISK_WINDOW_SAMPLES", "120"))
+    reward_compaction_interval_seconds: int = int(os.getenv("REWARD_COMPACTION_INTERVAL_SECONDS", "86400"))
+    reward_hot_days: int = int(os.getenv("REWARD_HOT_DAYS", "90"))
+    reward_compaction_chunk_size: int = int(os.getenv("REWARD_COMPACTION_CHUNK_SIZE", "1000"))
+    reward_archive_dir: str = os.getenv("REWARD_ARCHIVE_DIR", "./reward-archive")
+    pet_relevel_interval_seconds: int = int(os.getenv("PET_RELEVEL_INTERVAL_SECONDS", "86400"))
+    pet_relevel_chunk_size: int = int(os.getenv("PET_RELEVEL_CHUNK_SIZE", "5000"))
+    pet_relevel_on_start: bool = os.getenv("PET_RELEVEL_ON_START", "false").lower() == "true"
+    hunger_decay_interval_seconds: int = int(os.getenv("HUNGER_DECAY_INTERVAL_SECONDS", "3600"))
+    hunger_decay_chunk_size: int = int(os.getenv("HUNGER_DECAY_CHUNK_SIZE", "10000"))
+    hunger_read_correction: bool = os.getenv("HUNGER_READ_CORRECTION", "true").lower() == "true"
+    leaderboard_size: int = int(os.getenv("LEADERBOARD_SIZE", "100"))
+    write_coalescing: bool = os.getenv("WRITE_COALESCING", "false").lower() == "true"
+    write_batch_max: int = int(os.getenv("WRITE_BATCH_MAX", "32"))
+    write_batch_wait_ms: float = float(os.getenv("WRITE_BATCH_WAIT_MS", "2"))
+    write_conflict_retries: int = int(os.getenv("WRITE_CONFLICT_RETRIES", "3"))
+    user_lock_stripes: int = int(os.getenv("USER_LOCK_STRIPES", "64"))
 
     starter_cash: float = 10000.0
     starter_coins: int = 500
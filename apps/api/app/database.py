@@ -1,9 +1,15 @@
-from sqlalchemy import create_engine
+import logging
+
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 
 from .config import settings
 
 
+logger = logging.getLogger(__name__)
+
 engine_kwargs = {"pool_pre_ping": True}
 if settings.database_url.startswith("sqlite"):
     engine_kwargs["connect_args"] = {"check_same_thread": False}
@@ -11,6 +17,9 @@ if settings.database_url.startswith("sqlite"):
 engine = create_engine(settings.database_url, **engine_kwargs)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+RETIRED_INDEXES = {"reward_events": ["ix_reward_events_user_created_id_source"]}
+DEDUPLICATED_INDEXES = {"uq_reward_events_ref"}
+
 
 class Base(DeclarativeBase):
     pass
@@ -22,3 +31,42 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def dialect_insert(db, model):
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql_insert(model)
+    return sqlite_insert(model)
+
+
+def upgrade_schema(bind=engine):
+    inspector = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(bind.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" NOT NULL DEFAULT {column.server_default.arg}"
+                conn.execute(text(ddl))
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for name in RETIRED_INDEXES.get(table.name, []):
+                if name in existing_indexes:
+                    conn.execute(text(f"DROP INDEX {name}"))
+            for index in table.indexes:
+                if index.name in DEDUPLICATED_INDEXES and index.name not in existing_indexes:
+                    keys = ", ".join(column.name for column in index.columns)
+                    not_null = " AND ".join(f"{column.name} IS NOT NULL" for column in index.columns)
+                    removed = conn.execute(
+                        text(
+                            f"DELETE FROM {table.name} WHERE {not_null}"
+                            f" AND id NOT IN (SELECT MIN(id) FROM {table.name} GROUP BY {keys})"
+                        )
+                    ).rowcount
+                    if removed:
+                        logger.warning("removed %d duplicate %s rows before creating %s", removed, table.name, index.name)
+                index.create(conn, checkfirst=True)
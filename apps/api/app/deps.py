@@ -1,8 +1,11 @@
+from time import monotonic
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy.orm import Session
 
 from .auth import decode_token
+from .config import settings
 from .database import get_db
 from .models import User
 
@@ -23,3 +26,7 @@ def current_user(
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="user not found")
     return user
+
+
+def quote_deadline() -> float:
+    return monotonic() + settings.price_request_budget_seconds
@@ -0,0 +1,93 @@
+from collections import defaultdict
+from datetime import UTC, date, datetime, timedelta
+from time import monotonic
+
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import Session
+
+from .catalog import asset_catalog
+from .config import settings
+from .models import EquitySnapshot, Position, Wallet
+from .services import quotes_for_assets
+
+
+def record_equity_snapshots(db: Session, day: date | None = None, chunk_size: int | None = None) -> int:
+    day = day or datetime.now(UTC).date()
+    chunk_size = max(1, chunk_size or settings.equity_snapshot_chunk_size)
+    recorded = 0
+    last_user_id = 0
+    while True:
+        wallets = (
+            db.query(Wallet.user_id, Wallet.cash_balance)
+            .filter(Wallet.user_id > last_user_id)
+            .order_by(Wallet.user_id.asc())
+            .limit(chunk_size)
+            .all()
+        )
+        if not wallets:
+            break
+        user_ids = [row.user_id for row in wallets]
+        positions = (
+            db.query(Position.user_id, Position.symbol, Position.quantity, Position.avg_cost)
+            .filter(Position.user_id.in_(user_ids), Position.quantity > 0)
+            .all()
+        )
+        assets = [asset_catalog.get(symbol) for symbol in {row.symbol for row in positions}]
+        quotes = quotes_for_assets(
+            [asset for asset in assets if asset is not None],
+            monotonic() + settings.price_fetch_deadline_seconds,
+            strict=False,
+        )
+
+        market = defaultdict(float)
+        cost = defaultdict(float)
+        for row in positions:
+            price = quotes[row.symbol][0] if row.symbol in quotes else row.avg_cost
+            market[row.user_id] += row.quantity * price
+            cost[row.user_id] += row.quantity * row.avg_cost
+
+        db.execute(delete(EquitySnapshot).where(EquitySnapshot.day == day, EquitySnapshot.user_id.in_(user_ids)))
+        db.execute(
+            insert(EquitySnapshot),
+            [
+                {
+                    "user_id": row.user_id,
+                    "day": day,
+                    "cash": round(row.cash_balance, 2),
+                    "market_value": round(market[row.user_id], 2),
+                    "cost_basis": round(cost[row.user_id], 2),
+                }
+                for row in wallets
+            ],
+        )
+        db.commit()
+        recorded += len(wallets)
+        last_user_id = user_ids[-1]
+    return recorded
+
+
+def downsample(rows: list, points: int) -> list:
+    if len(rows) <= points:
+        return rows
+    step = (len(rows) - 1) / (points - 1)
+    return [rows[round(idx * step)] for idx in range(points)]
+
+
+def equity_history(db: Session, user_id: int, days: int, points: int) -> list[dict]:
+    start = datetime.now(UTC).date() - timedelta(days=days - 1)
+    rows = (
+        db.query(EquitySnapshot.day, EquitySnapshot.cash, EquitySnapshot.market_value, EquitySnapshot.cost_basis)
+        .filter(EquitySnapshot.user_id == user_id, EquitySnapshot.day >= start)
+        .order_by(EquitySnapshot.day.asc())
+        .all()
+    )
+    return [
+        {
+            "day": row.day,
+            "cash": row.cash,
+            "market_value": row.market_value,
+            "total_value": round(row.cash + row.market_value, 2),
+            "total_pl": round(row.market_value - row.cost_basis, 2),
+        }
+        for row in downsample(rows, points)
+    ]
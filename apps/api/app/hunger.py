@@ -0,0 +1,38 @@
+from datetime import UTC, datetime, time, timedelta
+from math import ceil
+
+from sqlalchemy import case, func, update
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .models import Pet
+from .services import HUNGER_DECAY_PER_DAY, HUNGER_MAX
+
+
+def _decayed_hunger(today_start: datetime):
+    saturation_days = ceil(HUNGER_MAX / HUNGER_DECAY_PER_DAY)
+    whens = []
+    for days in range(saturation_days, 0, -1):
+        decay = days * HUNGER_DECAY_PER_DAY
+        value = 0 if days == saturation_days else case((Pet.hunger > decay, Pet.hunger - decay), else_=0)
+        whens.append((Pet.last_hunger_tick < today_start - timedelta(days=days - 1), value))
+    return case(*whens, else_=Pet.hunger)
+
+
+def decay_pet_hunger(db: Session, now: datetime | None = None, chunk_size: int | None = None) -> int:
+    now = now or datetime.now(UTC).replace(tzinfo=None)
+    chunk_size = max(1, chunk_size or settings.hunger_decay_chunk_size)
+    today_start = datetime.combine(now.date(), time.min)
+    max_id = db.query(func.max(Pet.id)).scalar() or 0
+    hunger = _decayed_hunger(today_start)
+    decayed = 0
+    for low in range(0, max_id, chunk_size):
+        result = db.execute(
+            update(Pet)
+            .where(Pet.id > low, Pet.id <= low + chunk_size, Pet.last_hunger_tick < today_start)
+            .values(hunger=hunger, last_hunger_tick=now)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        decayed += result.rowcount
+    return decayed
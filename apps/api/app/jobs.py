@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from typing import Callable
+
+from .aggregates import reconcile_aggregates
+from .catalog import asset_catalog
+from .config import settings
+from .database import SessionLocal
+from .equity import record_equity_snapshots
+from .hunger import decay_pet_hunger
+from .leveling import relevel_pets
+from .orders import match_orders
+from .reward_ledger import compact_reward_events
+from .services import refresh_live_quotes, sample_risk_prices
+
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicJob:
+    def __init__(self, name: str, interval_seconds: float, func: Callable[[], object], run_on_start: bool = True):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.func = func
+        self.run_on_start = run_on_start
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name=f"job:{self.name}")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        if not self.run_on_start:
+            await asyncio.sleep(self.interval_seconds)
+        while True:
+            try:
+                await asyncio.to_thread(self.func)
+            except Exception:
+                logger.exception("%s job failed", self.name)
+            await asyncio.sleep(self.interval_seconds)
+
+
+def refresh_quotes():
+    refresh_live_quotes(asset_catalog.active())
+
+
+def reconcile_portfolio_aggregates():
+    with SessionLocal() as db:
+        mismatches = reconcile_aggregates(db, fix=settings.aggregate_reconcile_fix)
+    for mismatch in mismatches:
+        logger.warning("portfolio aggregate mismatch: %s", mismatch)
+
+
+def snapshot_equity():
+    with SessionLocal() as db:
+        recorded = record_equity_snapshots(db)
+    logger.info("recorded equity snapshots for %d users", recorded)
+
+
+def match_resting_orders():
+    with SessionLocal() as db:
+        filled = match_orders(db)
+    if filled:
+        logger.info("filled %d resting orders", filled)
+
+
+def sample_prices_for_risk():
+    sample_risk_prices(asset_catalog.active())
+
+
+def compact_reward_ledger():
+    with SessionLocal() as db:
+        compact_reward_events(db)
+
+
+def relevel_all_pets():
+    with SessionLocal() as db:
+        relevel_pets(db)
+
+
+def decay_hunger():
+    with SessionLocal() as db:
+        decay_pet_hunger(db)
+
+
+def scheduled_jobs() -> list[PeriodicJob]:
+    jobs = []
+    if settings.aggregate_reconcile_interval_seconds > 0:
+        jobs.append(
+            PeriodicJob(
+                "aggregate-reconciler",
+                settings.aggregate_reconcile_interval_seconds,
+                reconcile_portfolio_aggregates,
+                run_on_start=False,
+            )
+        )
+    if settings.equity_snapshot_interval_seconds > 0:
+        jobs.append(
+            PeriodicJob(
+                "equity-snapshots",
+                settings.equity_snapshot_interval_seconds,
+                snapshot_equity,
+                run_on_start=False,
+            )
+        )
+    if settings.order_match_interval_seconds > 0:
+        jobs.append(PeriodicJob("order-matcher", settings.order_match_interval_seconds, match_resting_orders))
+    if settings.risk_sample_interval_seconds > 0:
+        jobs.append(PeriodicJob("risk-sampler", settings.risk_sample_interval_seconds, sample_prices_for_risk))
+    if settings.reward_compaction_interval_seconds > 0:
+        jobs.append(
+            PeriodicJob(
+                "reward-compactor",
+                settings.reward_compaction_interval_seconds,
+                compact_reward_ledger,
+                run_on_start=False,
+            )
+        )
+    if settings.pet_relevel_interval_seconds > 0:
+        jobs.append(
+            PeriodicJob(
+                "pet-releveler",
+                settings.pet_relevel_interval_seconds,
+                relevel_all_pets,
+                run_on_start=settings.pet_relevel_on_start,
+            )
+        )
+    if settings.hunger_decay_interval_seconds > 0:
+        jobs.append(PeriodicJob("hunger-decay", settings.hunger_decay_interval_seconds, decay_hunger))
+    if settings.price_mode in {"finnhub", "hybrid"} and settings.price_refresh_interval_seconds > 0:
+        jobs.append(PeriodicJob("quote-refresher", settings.price_refresh_interval_seconds, refresh_quotes))
+    return jobs
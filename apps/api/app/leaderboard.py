@@ -0,0 +1,127 @@
+import heapq
+from array import array
+from threading import Lock
+from typing import Callable
+
+from sqlalchemy.orm import Session
+
+from .catalog import asset_catalog
+from .config import settings
+from .models import Pet, Position, Wallet
+from .services import price_snapshot_id, quotes_for_assets
+
+
+class PositionColumns:
+    def __init__(self):
+        self.user_ids = array("q")
+        self.pet_names: list[str] = []
+        self.cash = array("d")
+        self.symbols: list[str] = []
+        self.user_index = array("i")
+        self.symbol_index = array("i")
+        self.quantity = array("d")
+        self.avg_cost = array("d")
+
+    @classmethod
+    def load(cls, db: Session) -> "PositionColumns":
+        columns = cls()
+        users: dict[int, int] = {}
+        for user_id, cash, pet_name in (
+            db.query(Wallet.user_id, Wallet.cash_balance, Pet.name)
+            .join(Pet, Pet.user_id == Wallet.user_id)
+            .order_by(Wallet.user_id.asc())
+        ):
+            users[user_id] = len(columns.user_ids)
+            columns.user_ids.append(user_id)
+            columns.cash.append(cash)
+            columns.pet_names.append(pet_name)
+
+        symbols: dict[str, int] = {}
+        for user_id, symbol, quantity, avg_cost in db.query(
+            Position.user_id, Position.symbol, Position.quantity, Position.avg_cost
+        ).filter(Position.quantity > 0):
+            if user_id not in users:
+                continue
+            if symbol not in symbols:
+                symbols[symbol] = len(columns.symbols)
+                columns.symbols.append(symbol)
+            columns.user_index.append(users[user_id])
+            columns.symbol_index.append(symbols[symbol])
+            columns.quantity.append(quantity)
+            columns.avg_cost.append(avg_cost)
+        return columns
+
+    def market_values(self, prices: array) -> array:
+        market = array("d", bytes(8 * len(self.user_ids)))
+        for user, symbol, quantity, avg_cost in zip(self.user_index, self.symbol_index, self.quantity, self.avg_cost):
+            price = prices[symbol]
+            market[user] += quantity * (price if price >= 0 else avg_cost)
+        return market
+
+
+def rank_portfolios(columns: PositionColumns, prices: array, size: int) -> dict[str, list[dict]]:
+    market = columns.market_values(prices)
+    totals = array("d", (cash + value for cash, value in zip(columns.cash, market)))
+    starter = settings.starter_cash
+    returns = array("d", ((total - starter) / starter * 100 if starter else 0.0 for total in totals))
+
+    def entries(scores: array) -> list[dict]:
+        top = heapq.nlargest(size, range(len(scores)), key=lambda idx: (scores[idx], -columns.user_ids[idx]))
+        return [
+            {
+                "rank": rank,
+                "user_id": columns.user_ids[idx],
+                "pet_name": columns.pet_names[idx],
+                "total_value": round(totals[idx], 2),
+                "return_pct": round(returns[idx], 2),
+            }
+            for rank, idx in enumerate(top, start=1)
+        ]
+
+    return {"value": entries(totals), "return": entries(returns)}
+
+
+class LeaderboardCache:
+    def __init__(self, size: int):
+        self.size = size
+        self._lock = Lock()
+        self._snapshot: tuple[str, dict[str, list[dict]]] | None = None
+        self._hits = 0
+        self._builds = 0
+
+    def get(self, snapshot_id: str, build: Callable[[], dict[str, list[dict]]]) -> dict[str, list[dict]]:
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot[0] == snapshot_id:
+            self._hits += 1
+            return snapshot[1]
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot[0] == snapshot_id:
+                self._hits += 1
+                return snapshot[1]
+            rankings = build()
+            self._snapshot = (snapshot_id, rankings)
+            self._builds += 1
+            return rankings
+
+    def clear(self):
+        with self._lock:
+            self._snapshot = None
+
+    def stats(self) -> dict:
+        return {"hits": self._hits, "builds": self._builds, "snapshot_id": self._snapshot[0] if self._snapshot else None}
+
+
+leaderboard_cache = LeaderboardCache(settings.leaderboard_size)
+
+
+def build_leaderboard(db: Session, deadline: float | None = None) -> dict[str, list[dict]]:
+    columns = PositionColumns.load(db)
+    assets = [asset_catalog.get(symbol) for symbol in columns.symbols]
+    quotes = quotes_for_assets([asset for asset in assets if asset is not None], deadline)
+    prices = array("d", (quotes[symbol][0] if symbol in quotes else -1.0 for symbol in columns.symbols))
+    return rank_portfolios(columns, prices, leaderboard_cache.size)
+
+
+def current_leaderboard(db: Session, deadline: float | None = None) -> dict[str, list[dict]]:
+    return leaderboard_cache.get(price_snapshot_id(), lambda: build_leaderboard(db, deadline))
@@ -0,0 +1,64 @@
+import logging
+
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .models import Pet, Wallet
+from .services import LevelTable, level_table
+
+
+logger = logging.getLogger(__name__)
+
+
+def relevel_pets(db: Session, table: LevelTable | None = None, chunk_size: int | None = None) -> int:
+    table = table or level_table
+    chunk_size = max(1, chunk_size or settings.pet_relevel_chunk_size)
+    pets = Pet.__table__
+    guarded = (
+        update(pets)
+        .where(
+            pets.c.id == bindparam("pet_id"),
+            pets.c.level == bindparam("old_level"),
+            pets.c.xp_current == bindparam("old_xp_current"),
+        )
+        .values(level=bindparam("new_level"), xp_current=bindparam("new_xp_current"), stage=bindparam("new_stage"))
+    )
+    changed = 0
+    last_pet_id = 0
+    while True:
+        rows = (
+            db.query(Pet.id, Pet.level, Pet.xp_current, Pet.stage, Wallet.xp_total)
+            .join(Wallet, Wallet.user_id == Pet.user_id)
+            .filter(Pet.id > last_pet_id)
+            .order_by(Pet.id.asc())
+            .limit(chunk_size)
+            .all()
+        )
+        if not rows:
+            break
+        last_pet_id = rows[-1].id
+
+        levels = [table.level(row.xp_total) for row in rows]
+        stages = {level: table.stage(level) for level in {level for level, _ in levels}}
+        updates = [
+            {
+                "pet_id": row.id,
+                "old_level": row.level,
+                "old_xp_current": row.xp_current,
+                "new_level": level,
+                "new_xp_current": xp_current,
+                "new_stage": stages[level],
+            }
+            for row, (level, xp_current) in zip(rows, levels)
+            if (row.level, row.xp_current, row.stage) != (level, xp_current, stages[level])
+        ]
+        if updates:
+            result = db.execute(guarded, updates)
+            db.commit()
+            changed += result.rowcount
+        else:
+            db.rollback()
+    if changed:
+        logger.info("re-leveled %d pets", changed)
+    return changed
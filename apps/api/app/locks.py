@@ -0,0 +1,35 @@
+import threading
+from contextlib import contextmanager
+
+from .config import settings
+
+
+class StripedLock:
+    def __init__(self, stripes: int):
+        self._locks = [threading.Lock() for _ in range(max(1, stripes))]
+        self._stats_lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+
+    def for_key(self, key: int) -> threading.Lock:
+        return self._locks[hash(key) % len(self._locks)]
+
+    @contextmanager
+    def hold(self, key: int):
+        lock = self.for_key(key)
+        contended = not lock.acquire(blocking=False)
+        if contended:
+            lock.acquire()
+        with self._stats_lock:
+            self.acquisitions += 1
+            self.contended += int(contended)
+        try:
+            yield
+        finally:
+            lock.release()
+
+    def stats(self) -> dict:
+        return {"stripes": len(self._locks), "acquisitions": self.acquisitions, "contended": self.contended}
+
+
+user_locks = StripedLock(settings.user_lock_stripes)
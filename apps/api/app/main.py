@@ -2,24 +2,45 @@ from contextlib import asynccontextmanager
 from uuid import uuid4
 
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from sqlalchemy import text
+from sqlalchemy.orm.exc import StaleDataError
 
 from .config import settings
-from .database import Base, engine, SessionLocal
-from .routers import auth, users, market, trading, learning, economy
+from .database import Base, engine, SessionLocal, upgrade_schema
+from .jobs import scheduled_jobs
+from .leaderboard import leaderboard_cache
+from .locks import user_locks
+from .orders import order_book
+from .risk import risk_model
+from .quote_client import provider_breaker, provider_client
+from .routers import auth, users, market, trading, learning, economy, leaderboard
 from .seed import seed_if_needed
+from .services import portfolio_cache_stats, quote_cache_stats, quote_fetch_stats
+from .write_queue import write_queue
 
 
 @asynccontextmanager
 async def lifespan(_: FastAPI):
     Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
     with SessionLocal() as db:
         seed_if_needed(db)
+    provider_client.open()
+    if settings.write_coalescing:
+        write_queue.start()
+    jobs = scheduled_jobs()
+    for job in jobs:
+        job.start()
     yield
+    for job in jobs:
+        await job.stop()
+    write_queue.stop()
+    provider_client.close()
 
 
 app = FastAPI(
@@ -37,6 +58,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["Authorization", "Content-Type", "X-Idempotency-Key"],
+    expose_headers=["X-Next-Cursor"],
 )
 app.add_middleware(GZipMiddleware, minimum_size=1024)
 app.add_middleware(TrustedHostMiddleware, allowed_hosts=settings.trusted_hosts)
@@ -52,12 +74,18 @@ async def add_request_id(request: Request, call_next):
     return response
 
 
+@app.exception_handler(StaleDataError)
+async def stale_data_handler(_: Request, __: StaleDataError):
+    return JSONResponse(status_code=409, content={"detail": "concurrent update, please retry"})
+
+
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(market.router)
 app.include_router(trading.router)
 app.include_router(learning.router)
 app.include_router(economy.router)
+app.include_router(leaderboard.router)
 
 
 @app.get("/health")
@@ -65,6 +93,21 @@ def health():
     return {"ok": True, "service": settings.app_name, "environment": settings.environment}
 
 
+@app.get("/metrics")
+def metrics():
+    return {
+        "quote_provider": {**provider_client.stats(), "breaker": provider_breaker.stats()},
+        "quote_fetches": quote_fetch_stats(),
+        "quote_cache": quote_cache_stats(),
+        "portfolio_cache": portfolio_cache_stats(),
+        "leaderboard": leaderboard_cache.stats(),
+        "order_book": order_book.stats(),
+        "risk_model": risk_model.stats(),
+        "write_queue": write_queue.stats(),
+        "user_locks": user_locks.stats(),
+    }
+
+
 @app.get("/ready")
 def ready():
     with SessionLocal() as db:
@@ -1,10 +1,13 @@
-from datetime import datetime, UTC
+from datetime import date, datetime, UTC
 
 from sqlalchemy import (
+    BigInteger,
     Boolean,
+    Date,
     DateTime,
     Float,
     ForeignKey,
+    Index,
     Integer,
     JSON,
     String,
@@ -35,6 +38,10 @@ class Wallet(Base):
     cash_balance: Mapped[float] = mapped_column(Float, default=0.0)
     coins_balance: Mapped[int] = mapped_column(Integer, default=0)
     xp_total: Mapped[int] = mapped_column(Integer, default=0)
+    portfolio_version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+
+    __mapper_args__ = {"version_id_col": version}
 
 
 class Pet(Base):
@@ -75,10 +82,34 @@ class Position(Base):
     symbol: Mapped[str] = mapped_column(ForeignKey("assets.symbol"), index=True)
     quantity: Mapped[int] = mapped_column(Integer, default=0)
     avg_cost: Mapped[float] = mapped_column(Float, default=0.0)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+
+    __mapper_args__ = {"version_id_col": version}
+
+
+class PortfolioAggregate(Base):
+    __tablename__ = "portfolio_aggregates"
+
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    cost_basis: Mapped[float] = mapped_column(Float, default=0.0)
+    position_count: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow, onupdate=utcnow)
+
+
+class SectorExposure(Base):
+    __tablename__ = "sector_exposures"
+    __table_args__ = (UniqueConstraint("user_id", "sector", name="uq_user_sector"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
+    sector: Mapped[str] = mapped_column(String)
+    cost_basis: Mapped[float] = mapped_column(Float, default=0.0)
+    position_count: Mapped[int] = mapped_column(Integer, default=0)
 
 
 class Trade(Base):
     __tablename__ = "trades"
+    __table_args__ = (Index("ix_trades_user_executed_id", "user_id", "executed_at", "id"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
@@ -89,6 +120,40 @@ class Trade(Base):
     executed_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow)
 
 
+class Order(Base):
+    __tablename__ = "orders"
+    __table_args__ = (
+        Index("ix_orders_status_id", "status", "id"),
+        Index("ix_orders_user_status_id", "user_id", "status", "id"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    symbol: Mapped[str] = mapped_column(ForeignKey("assets.symbol"))
+    side: Mapped[str] = mapped_column(String)
+    order_type: Mapped[str] = mapped_column(String)
+    quantity: Mapped[float] = mapped_column(Float)
+    trigger_price: Mapped[float] = mapped_column(Float)
+    status: Mapped[str] = mapped_column(String, default="open")
+    fill_price: Mapped[float | None] = mapped_column(Float, nullable=True)
+    reason: Mapped[str | None] = mapped_column(String, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow)
+    closed_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+
+
+class EquitySnapshot(Base):
+    __tablename__ = "equity_snapshots"
+    __table_args__ = (Index("ix_equity_snapshots_user_day", "user_id", "day", unique=True),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    day: Mapped[date] = mapped_column(Date)
+    cash: Mapped[float] = mapped_column(Float)
+    market_value: Mapped[float] = mapped_column(Float)
+    cost_basis: Mapped[float] = mapped_column(Float)
+    recorded_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow)
+
+
 class Lesson(Base):
     __tablename__ = "lessons"
 
@@ -148,6 +213,20 @@ class Inventory(Base):
 
 class RewardEvent(Base):
     __tablename__ = "reward_events"
+    __table_args__ = (
+        Index("uq_reward_events_ref", "user_id", "source", "ref_type", "ref_id", unique=True),
+        Index(
+            "ix_reward_events_history_covering",
+            "user_id",
+            "created_at",
+            "id",
+            "source",
+            "xp_delta",
+            "coin_delta",
+            "ref_type",
+            "ref_id",
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
@@ -159,6 +238,29 @@ class RewardEvent(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=utcnow)
 
 
+class RewardRollup(Base):
+    __tablename__ = "reward_rollups"
+    __table_args__ = (
+        Index("uq_reward_rollups_user_day_source", "user_id", "day", "source", unique=True),
+        Index("ix_reward_rollups_user_day_id", "user_id", "day", "id"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    day: Mapped[date] = mapped_column(Date)
+    source: Mapped[str] = mapped_column(String)
+    event_count: Mapped[int] = mapped_column(Integer, default=0)
+    xp_total: Mapped[int] = mapped_column(Integer, default=0)
+    coin_total: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class RewardTombstone(Base):
+    __tablename__ = "reward_tombstones"
+
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    digest: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+
+
 class RefreshToken(Base):
     __tablename__ = "refresh_tokens"
 
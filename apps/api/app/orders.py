@@ -0,0 +1,207 @@
+import heapq
+import logging
+from threading import Lock
+from uuid import uuid4
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .catalog import asset_catalog
+from .config import settings
+from .models import Order, Position, Wallet, utcnow
+from .services import apply_buy, apply_sell, grant_reward, price_snapshot_id, quotes_for_assets
+from .write_queue import run_write
+
+
+logger = logging.getLogger(__name__)
+
+
+def fires_on_drop(side: str, order_type: str) -> bool:
+    return (side == "buy") == (order_type == "limit")
+
+
+class OrderBook:
+    def __init__(self):
+        self._lock = Lock()
+        self._falling: dict[str, list[tuple[float, int]]] = {}
+        self._rising: dict[str, list[tuple[float, int]]] = {}
+        self._open: dict[int, str] = {}
+        self._last_loaded_id = 0
+        self._last_snapshot: str | None = None
+        self._dirty = False
+        self.matched = 0
+
+    def add(self, order_id: int, symbol: str, side: str, order_type: str, trigger_price: float):
+        with self._lock:
+            if order_id in self._open:
+                return
+            self._open[order_id] = symbol
+            if fires_on_drop(side, order_type):
+                heapq.heappush(self._falling.setdefault(symbol, []), (-trigger_price, order_id))
+            else:
+                heapq.heappush(self._rising.setdefault(symbol, []), (trigger_price, order_id))
+            self._dirty = True
+
+    def discard(self, order_id: int):
+        with self._lock:
+            self._open.pop(order_id, None)
+            self._compact()
+
+    def sync(self, db: Session):
+        rows = (
+            db.query(Order.id, Order.symbol, Order.side, Order.order_type, Order.trigger_price)
+            .filter(Order.status == "open", Order.id > self._last_loaded_id)
+            .order_by(Order.id.asc())
+            .all()
+        )
+        for row in rows:
+            self.add(row.id, row.symbol, row.side, row.order_type, row.trigger_price)
+        if rows:
+            self._last_loaded_id = rows[-1].id
+
+        open_count = db.query(func.count(Order.id)).filter(Order.status == "open").scalar()
+        if open_count != len(self._open):
+            open_ids = {order_id for (order_id,) in db.query(Order.id).filter(Order.status == "open")}
+            with self._lock:
+                for order_id in [order_id for order_id in self._open if order_id not in open_ids]:
+                    del self._open[order_id]
+                self._compact()
+
+    def _compact(self):
+        live = len(self._open)
+        entries = sum(len(heap) for heap in self._falling.values()) + sum(len(heap) for heap in self._rising.values())
+        if entries - live <= live:
+            return
+        for heaps in (self._falling, self._rising):
+            for symbol in list(heaps):
+                heap = [entry for entry in heaps[symbol] if entry[1] in self._open]
+                if heap:
+                    heapq.heapify(heap)
+                    heaps[symbol] = heap
+                else:
+                    del heaps[symbol]
+
+    def symbols(self) -> set[str]:
+        with self._lock:
+            return set(self._open.values())
+
+    def crossed(self, symbol: str, price: float) -> list[int]:
+        order_ids = []
+        with self._lock:
+            falling = self._falling.get(symbol, [])
+            while falling and -falling[0][0] >= price:
+                _, order_id = heapq.heappop(falling)
+                if self._open.pop(order_id, None) is not None:
+                    order_ids.append(order_id)
+            rising = self._rising.get(symbol, [])
+            while rising and rising[0][0] <= price:
+                _, order_id = heapq.heappop(rising)
+                if self._open.pop(order_id, None) is not None:
+                    order_ids.append(order_id)
+        return sorted(order_ids)
+
+    def should_match(self, snapshot_id: str) -> bool:
+        with self._lock:
+            if snapshot_id == self._last_snapshot and not self._dirty:
+                return False
+            self._last_snapshot = snapshot_id
+            self._dirty = False
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._falling.clear()
+            self._rising.clear()
+            self._open.clear()
+            self._last_loaded_id = 0
+            self._last_snapshot = None
+            self._dirty = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "open": len(self._open),
+                "symbols": len(set(self._open.values())),
+                "heap_entries": sum(len(heap) for heap in self._falling.values())
+                + sum(len(heap) for heap in self._rising.values()),
+                "matched": self.matched,
+            }
+
+
+order_book = OrderBook()
+
+
+def fill_order(db: Session, order_id: int, user_id: int, price: float) -> str:
+    def execute(db: Session) -> str:
+        order = db.get(Order, order_id)
+        if order is None or order.status != "open":
+            return order.status if order else "missing"
+        asset = asset_catalog.get(order.symbol)
+        wallet = db.query(Wallet).filter(Wallet.user_id == user_id).one()
+        position = (
+            db.query(Position)
+            .filter(Position.user_id == user_id, Position.symbol == order.symbol)
+            .first()
+        )
+        if asset is None:
+            order.status, order.reason = "rejected", "asset not available"
+        elif order.side == "buy" and wallet.cash_balance < round(price * order.quantity, 2):
+            order.status, order.reason = "rejected", "insufficient cash"
+        elif order.side == "sell" and (not position or position.quantity < order.quantity):
+            order.status, order.reason = "rejected", "insufficient quantity"
+        else:
+            if order.side == "buy":
+                apply_buy(db, wallet, position, asset, order.quantity, price)
+            else:
+                apply_sell(db, wallet, position, asset, order.quantity, price)
+            grant_reward(
+                db,
+                user_id,
+                "trade",
+                settings.reward_trade_xp,
+                settings.reward_trade_coins,
+                "trade",
+                f"order:{order.id}:{uuid4().hex}",
+            )
+            order.status = "filled"
+            order.fill_price = price
+        order.closed_at = utcnow()
+        return order.status
+
+    return run_write(db, execute, user_id)
+
+
+def match_orders(db: Session, deadline: float | None = None) -> int:
+    order_book.sync(db)
+    db.rollback()
+    if not order_book.should_match(price_snapshot_id()):
+        return 0
+    assets = [asset for asset in (asset_catalog.get(symbol) for symbol in order_book.symbols()) if asset is not None]
+    if not assets:
+        return 0
+    quotes = quotes_for_assets(assets, deadline)
+
+    filled = 0
+    for symbol, (price, _) in quotes.items():
+        order_ids = order_book.crossed(symbol, price)
+        if not order_ids:
+            continue
+        rows = (
+            db.query(Order.id, Order.user_id, Order.side, Order.order_type, Order.trigger_price)
+            .filter(Order.id.in_(order_ids))
+            .order_by(Order.id.asc())
+            .all()
+        )
+        db.rollback()
+        for row in rows:
+            try:
+                status = fill_order(db, row.id, row.user_id, price)
+            except Exception:
+                logger.exception("order %s fill failed; will retry", row.id)
+                db.rollback()
+                order_book.add(row.id, symbol, row.side, row.order_type, row.trigger_price)
+                continue
+            if status == "filled":
+                filled += 1
+    order_book.matched += filled
+    return filled
@@ -0,0 +1,45 @@
+from collections import OrderedDict
+from threading import Lock
+
+
+class PortfolioCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = Lock()
+        self._entries: OrderedDict[int, tuple[int, str, dict]] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, user_id: int, version: int, snapshot_id: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == version and entry[1] == snapshot_id:
+                self._entries.move_to_end(user_id)
+                self._hits += 1
+                return entry[2]
+            self._misses += 1
+            return None
+
+    def put(self, user_id: int, version: int, snapshot_id: str, snapshot: dict):
+        with self._lock:
+            self._entries[user_id] = (version, snapshot_id, snapshot)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "entries": len(self._entries),
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            }
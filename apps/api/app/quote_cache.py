@@ -0,0 +1,136 @@
+from collections import OrderedDict
+import logging
+import sqlite3
+from threading import Lock, local
+from time import time
+
+from .config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class QuoteCache:
+    def __init__(self, max_entries: int, backoff_seconds: float, max_backoff_seconds: float):
+        self.max_entries = max_entries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self._lock = Lock()
+        self._entries: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._failures: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        self._counts = {"hits": 0, "misses": 0, "stale": 0, "negative": 0, "evictions": 0}
+
+    def lookup(self, symbol: str, fresh_for: float, stale_for: float) -> tuple[str, tuple[float, float] | None]:
+        now_ts = time()
+        with self._lock:
+            entry = self._entries.get(symbol)
+            if entry is not None:
+                self._entries.move_to_end(symbol)
+                age = now_ts - entry[1]
+                if age < fresh_for:
+                    self._counts["hits"] += 1
+                    return "hit", entry
+                if age < stale_for:
+                    self._counts["stale"] += 1
+                    return "stale", entry
+            if self._suppressed(symbol, now_ts):
+                self._counts["negative"] += 1
+                return "negative", None
+            self._counts["misses"] += 1
+            return "miss", None
+
+    def peek(self, symbol: str) -> tuple[float, float] | None:
+        with self._lock:
+            return self._entries.get(symbol)
+
+    def is_suppressed(self, symbol: str) -> bool:
+        with self._lock:
+            return self._suppressed(symbol, time())
+
+    def put(self, symbol: str, quote: tuple[float, float]):
+        with self._lock:
+            current = self._entries.get(symbol)
+            if current is None or quote[1] >= current[1]:
+                self._entries[symbol] = quote
+            self._entries.move_to_end(symbol)
+            self._failures.pop(symbol, None)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counts["evictions"] += 1
+
+    def record_failure(self, symbol: str):
+        with self._lock:
+            failures = self._failures.pop(symbol, (0, 0.0))[0] + 1
+            backoff = min(self.backoff_seconds * 2 ** (failures - 1), self.max_backoff_seconds)
+            self._failures[symbol] = (failures, time() + backoff)
+            while len(self._failures) > self.max_entries:
+                self._failures.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._failures.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = sum(self._counts[key] for key in ("hits", "misses", "stale", "negative"))
+            return {
+                **self._counts,
+                "entries": len(self._entries),
+                "backing_off": len(self._failures),
+                "hit_rate": round((self._counts["hits"] + self._counts["stale"]) / lookups, 4) if lookups else 0.0,
+            }
+
+    def _suppressed(self, symbol: str, now_ts: float) -> bool:
+        failure = self._failures.get(symbol)
+        return failure is not None and now_ts < failure[1]
+
+
+class SQLiteQuoteStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = local()
+
+    def get_many(self, symbols: list[str]) -> dict[str, tuple[float, float]]:
+        if not symbols:
+            return {}
+        placeholders = ",".join("?" for _ in symbols)
+        try:
+            rows = self._conn().execute(
+                f"SELECT symbol, price, fetched_at FROM quotes WHERE symbol IN ({placeholders})",
+                symbols,
+            ).fetchall()
+        except sqlite3.Error as exc:
+            logger.warning("shared quote cache read failed: %s", exc)
+            return {}
+        return {symbol: (price, fetched_at) for symbol, price, fetched_at in rows}
+
+    def put(self, symbol: str, price: float, fetched_at: float):
+        try:
+            with self._conn() as conn:
+                conn.execute(
+                    "INSERT INTO quotes (symbol, price, fetched_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(symbol) DO UPDATE SET price = excluded.price, fetched_at = excluded.fetched_at "
+                    "WHERE excluded.fetched_at > quotes.fetched_at",
+                    (symbol, price, fetched_at),
+                )
+        except sqlite3.Error as exc:
+            logger.warning("shared quote cache write failed for %s: %s", symbol, exc)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS quotes (symbol TEXT PRIMARY KEY, price REAL NOT NULL, fetched_at REAL NOT NULL)")
+            self._local.conn = conn
+        return conn
+
+
+def build_shared_quote_store() -> SQLiteQuoteStore | None:
+    if settings.quote_cache_backend == "sqlite":
+        return SQLiteQuoteStore(settings.quote_cache_path)
+    if settings.quote_cache_backend != "memory":
+        logger.warning("unknown QUOTE_CACHE_BACKEND %r; using the in-process cache only", settings.quote_cache_backend)
+    return None
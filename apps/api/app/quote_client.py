@@ -0,0 +1,156 @@
+import logging
+from threading import Lock
+from time import monotonic
+
+import httpx
+
+from .config import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class QuoteProviderClient:
+    def __init__(self):
+        self._client: httpx.Client | None = None
+        self._http2 = False
+        self._lock = Lock()
+        self._requests = 0
+        self._connections_opened = 0
+        self._connections_reused = 0
+        self._waiting = 0
+        self._max_waiting = 0
+
+    def open(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None:
+                self._client, self._http2 = _build_client()
+            return self._client
+
+    def close(self):
+        with self._lock:
+            client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+    def get(self, path: str, params: dict) -> httpx.Response:
+        client = self._client or self.open()
+        state = {"waiting": True, "opened": False}
+
+        def trace(event: str, _info: dict):
+            if state["waiting"] and event.endswith((".connect_tcp.started", ".send_request_headers.started")):
+                state["waiting"] = False
+                self._track_waiting(-1)
+            if event == "connection.connect_tcp.complete":
+                state["opened"] = True
+
+        self._track_waiting(1)
+        try:
+            return client.get(path, params=params, extensions={"trace": trace})
+        finally:
+            with self._lock:
+                if state["waiting"]:
+                    self._waiting -= 1
+                self._requests += 1
+                if state["opened"]:
+                    self._connections_opened += 1
+                else:
+                    self._connections_reused += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "open": self._client is not None,
+                "http2": self._http2,
+                "requests": self._requests,
+                "connections_opened": self._connections_opened,
+                "connections_reused": self._connections_reused,
+                "waiting": self._waiting,
+                "max_waiting": self._max_waiting,
+            }
+
+    def _track_waiting(self, delta: int):
+        with self._lock:
+            self._waiting += delta
+            self._max_waiting = max(self._max_waiting, self._waiting)
+
+
+def _build_client() -> tuple[httpx.Client, bool]:
+    http2 = settings.finnhub_http2
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("FINNHUB_HTTP2 is enabled but the h2 package is not installed; falling back to HTTP/1.1")
+            http2 = False
+
+    client = httpx.Client(
+        base_url=settings.finnhub_base_url,
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.finnhub_max_connections,
+            max_keepalive_connections=settings.finnhub_max_keepalive_connections,
+            keepalive_expiry=settings.finnhub_keepalive_expiry_seconds,
+        ),
+        timeout=httpx.Timeout(
+            settings.finnhub_timeout_seconds,
+            pool=settings.finnhub_pool_timeout_seconds,
+        ),
+    )
+    return client, http2
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._trips = 0
+        self._rejected = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == "open" and monotonic() - self._opened_at >= self.reset_seconds:
+                self._state = "half_open"
+                self._trial_in_flight = False
+            if self._state == "closed":
+                return True
+            if self._state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self._rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = "closed"
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == "half_open" or self._failures >= self.failure_threshold:
+                if self._state != "open":
+                    self._trips += 1
+                    logger.warning("quote provider circuit opened after %d failures", self._failures)
+                self._state = "open"
+                self._opened_at = monotonic()
+                self._trial_in_flight = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "trips": self._trips,
+                "rejected": self._rejected,
+            }
+
+
+provider_client = QuoteProviderClient()
+provider_breaker = CircuitBreaker(settings.finnhub_breaker_failure_threshold, settings.finnhub_breaker_reset_seconds)
@@ -0,0 +1,202 @@
+from collections import defaultdict
+from datetime import UTC, date, datetime, time, timedelta
+import gzip
+import hashlib
+import json
+import logging
+import os
+from uuid import uuid4
+
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .database import dialect_insert
+from .models import RewardEvent, RewardRollup, RewardTombstone
+
+
+logger = logging.getLogger(__name__)
+
+
+def reward_digest(user_id: int, source: str, ref_type: str, ref_id: str) -> int:
+    raw = hashlib.sha256(f"{user_id}\x1f{source}\x1f{ref_type}\x1f{ref_id}".encode()).digest()
+    return int.from_bytes(raw[:8], "big", signed=True)
+
+
+def compacted_reward_keys(db: Session, user_id: int, keys: list[tuple[str, str, str]]) -> set[tuple[str, str, str]]:
+    if not keys:
+        return set()
+    digests = {reward_digest(user_id, *key): key for key in keys}
+    found = (
+        db.query(RewardTombstone.digest)
+        .filter(RewardTombstone.user_id == user_id, RewardTombstone.digest.in_(digests))
+        .all()
+    )
+    return {digests[row.digest] for row in found}
+
+
+def compaction_cutoff(now: datetime | None = None, hot_days: int | None = None) -> datetime:
+    now = now or datetime.now(UTC)
+    days = settings.reward_hot_days if hot_days is None else hot_days
+    return datetime.combine(now.date() - timedelta(days=days), time.min)
+
+
+def _archive(rows: list, archive_dir: str) -> str:
+    os.makedirs(archive_dir, exist_ok=True)
+    stamp = datetime.now(UTC).strftime("%Y%m%dT%H%M%S")
+    path = os.path.join(
+        archive_dir, f"reward-events-{stamp}-{rows[0].id}-{rows[-1].id}-{uuid4().hex[:12]}.ndjson.gz"
+    )
+    with gzip.open(path, "wt", encoding="utf-8") as handle:
+        for row in rows:
+            record = {
+                "id": row.id,
+                "user_id": row.user_id,
+                "source": row.source,
+                "xp_delta": row.xp_delta,
+                "coin_delta": row.coin_delta,
+                "ref_type": row.ref_type,
+                "ref_id": row.ref_id,
+                "created_at": row.created_at.isoformat(),
+            }
+            handle.write(json.dumps(record, separators=(",", ":")) + "\n")
+        handle.flush()
+        os.fsync(handle.fileno())
+    return path
+
+
+def compact_reward_events(
+    db: Session,
+    cutoff: datetime | None = None,
+    archive_dir: str | None = None,
+    chunk_size: int | None = None,
+) -> int:
+    cutoff = cutoff or compaction_cutoff()
+    archive_dir = archive_dir or settings.reward_archive_dir
+    chunk_size = max(1, chunk_size or settings.reward_compaction_chunk_size)
+    compacted = 0
+    while True:
+        claimable = (
+            select(RewardEvent.id)
+            .where(RewardEvent.created_at < cutoff)
+            .order_by(RewardEvent.id.asc())
+            .limit(chunk_size)
+            .with_for_update(skip_locked=True)
+        )
+        claim = (
+            delete(RewardEvent)
+            .where(RewardEvent.id.in_(claimable.scalar_subquery()))
+            .returning(
+                RewardEvent.id,
+                RewardEvent.user_id,
+                RewardEvent.source,
+                RewardEvent.xp_delta,
+                RewardEvent.coin_delta,
+                RewardEvent.ref_type,
+                RewardEvent.ref_id,
+                RewardEvent.created_at,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        rows = sorted(db.execute(claim).all(), key=lambda row: row.id)
+        if not rows:
+            db.rollback()
+            break
+
+        rollups: dict[tuple[int, date, str], list[int]] = defaultdict(lambda: [0, 0, 0])
+        for row in rows:
+            totals = rollups[(row.user_id, row.created_at.date(), row.source)]
+            totals[0] += 1
+            totals[1] += row.xp_delta
+            totals[2] += row.coin_delta
+
+        path = None
+        try:
+            path = _archive(rows, archive_dir)
+            upsert = dialect_insert(db, RewardRollup)
+            for (user_id, day, source), (count, xp, coins) in rollups.items():
+                db.execute(
+                    upsert.values(user_id=user_id, day=day, source=source, event_count=count, xp_total=xp, coin_total=coins)
+                    .on_conflict_do_update(
+                        index_elements=["user_id", "day", "source"],
+                        set_={
+                            "event_count": RewardRollup.event_count + count,
+                            "xp_total": RewardRollup.xp_total + xp,
+                            "coin_total": RewardRollup.coin_total + coins,
+                        },
+                    )
+                )
+            db.execute(
+                dialect_insert(db, RewardTombstone).on_conflict_do_nothing(),
+                [
+                    {"user_id": row.user_id, "digest": reward_digest(row.user_id, row.source, row.ref_type, row.ref_id)}
+                    for row in rows
+                ],
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            if path is not None:
+                os.remove(path)
+            raise
+        compacted += len(rows)
+        logger.info("compacted %d reward events into %s", len(rows), path)
+    return compacted
+
+
+def _rollup_out(row: RewardRollup) -> dict:
+    return {
+        "source": row.source,
+        "xp_delta": row.xp_total,
+        "coin_delta": row.coin_total,
+        "ref_type": "rollup",
+        "ref_id": row.day.isoformat(),
+        "event_count": row.event_count,
+        "created_at": datetime.combine(row.day, time.min),
+    }
+
+
+def _event_out(row: RewardEvent) -> dict:
+    return {
+        "source": row.source,
+        "xp_delta": row.xp_delta,
+        "coin_delta": row.coin_delta,
+        "ref_type": row.ref_type,
+        "ref_id": row.ref_id,
+        "event_count": 1,
+        "created_at": row.created_at,
+    }
+
+
+def reward_history_page(
+    db: Session,
+    user_id: int,
+    limit: int,
+    source: str | None = None,
+    after: tuple[datetime, int] | None = None,
+) -> tuple[list[dict], tuple[datetime, int] | None]:
+    items: list[dict] = []
+    keys: list[tuple[datetime, int]] = []
+    if after is None or after[1] > 0:
+        query = db.query(RewardEvent).filter(RewardEvent.user_id == user_id)
+        if source:
+            query = query.filter(RewardEvent.source == source)
+        if after is not None:
+            query = query.filter(tuple_(RewardEvent.created_at, RewardEvent.id) < after)
+        for row in query.order_by(RewardEvent.created_at.desc(), RewardEvent.id.desc()).limit(limit + 1):
+            items.append(_event_out(row))
+            keys.append((row.created_at, row.id))
+
+    if len(items) <= limit:
+        query = db.query(RewardRollup).filter(RewardRollup.user_id == user_id)
+        if source:
+            query = query.filter(RewardRollup.source == source)
+        if after is not None and after[1] < 0:
+            query = query.filter(tuple_(RewardRollup.day, RewardRollup.id) < (after[0].date(), -after[1]))
+        for row in query.order_by(RewardRollup.day.desc(), RewardRollup.id.desc()).limit(limit + 1 - len(items)):
+            items.append(_rollup_out(row))
+            keys.append((datetime.combine(row.day, time.min), -row.id))
+
+    if len(items) > limit:
+        return items[:limit], keys[limit - 1]
+    return items, None
@@ -0,0 +1,99 @@
+from collections import deque
+from itertools import combinations
+from math import sqrt
+from threading import Lock
+
+from .config import settings
+
+
+def returns_from_prices(prices: deque[float]) -> list[float]:
+    series = list(prices)
+    return [current / previous - 1 for previous, current in zip(series, series[1:])]
+
+
+def covariance(x: list[float], y: list[float]) -> float:
+    n = min(len(x), len(y))
+    x, y = x[-n:], y[-n:]
+    mean_x = sum(x) / n
+    mean_y = sum(y) / n
+    return sum((a - mean_x) * (b - mean_y) for a, b in zip(x, y)) / (n - 1)
+
+
+class RiskModel:
+    def __init__(self, window: int):
+        self.window = max(2, window)
+        self._lock = Lock()
+        self._prices: dict[str, deque[float]] = {}
+        self._last_sample: str | None = None
+        self._samples = 0
+        self._matrix: tuple[str | None, dict[str, float], dict[tuple[str, str], float]] = (None, {}, {})
+
+    def record(self, sample_id: str, prices: dict[str, float]) -> bool:
+        with self._lock:
+            if sample_id == self._last_sample:
+                return False
+            for symbol, series in self._prices.items():
+                if symbol not in prices:
+                    series.append(series[-1])
+            for symbol, price in prices.items():
+                if price > 0:
+                    self._prices.setdefault(symbol, deque(maxlen=self.window + 1)).append(price)
+            self._last_sample = sample_id
+            self._samples += 1
+            return True
+
+    def refresh(self) -> bool:
+        with self._lock:
+            sample_id = self._last_sample
+            if self._matrix[0] == sample_id:
+                return False
+            returns = {symbol: returns_from_prices(series) for symbol, series in self._prices.items() if len(series) >= 3}
+
+        variances = {symbol: covariance(series, series) for symbol, series in returns.items()}
+        covariances = {(symbol, symbol): variance for symbol, variance in variances.items()}
+        for a, b in combinations(sorted(returns), 2):
+            covariances[(a, b)] = covariance(returns[a], returns[b])
+        self._matrix = (sample_id, {symbol: sqrt(variance) for symbol, variance in variances.items()}, covariances)
+        return True
+
+    def volatility(self, symbol: str) -> float | None:
+        return self._matrix[1].get(symbol)
+
+    def correlation(self, a: str, b: str) -> float | None:
+        _, volatilities, covariances = self._matrix
+        cov = covariances.get((min(a, b), max(a, b)))
+        if cov is None or not volatilities.get(a) or not volatilities.get(b):
+            return None
+        return cov / (volatilities[a] * volatilities[b])
+
+    def portfolio_risk(self, weights: dict[str, float]) -> dict | None:
+        sample_id, volatilities, covariances = self._matrix
+        if sample_id is None or not weights or any(symbol not in volatilities for symbol in weights):
+            return None
+        symbols = sorted(weights)
+        variance = sum(weights[symbol] ** 2 * covariances[(symbol, symbol)] for symbol in symbols)
+        variance += 2 * sum(weights[a] * weights[b] * covariances[(a, b)] for a, b in combinations(symbols, 2))
+        weighted_volatility = sum(weights[symbol] * volatilities[symbol] for symbol in symbols)
+        if variance <= 0 or weighted_volatility <= 0:
+            return None
+        volatility = sqrt(variance)
+        ratio = weighted_volatility / volatility
+        return {
+            "volatility_pct": round(volatility * 100, 4),
+            "diversification_ratio": round(ratio, 4),
+            "effective_positions": round(ratio**2, 2),
+            "samples": min(len(self._prices[symbol]) for symbol in symbols) - 1,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._prices.clear()
+            self._last_sample = None
+            self._samples = 0
+            self._matrix = (None, {}, {})
+
+    def stats(self) -> dict:
+        return {"symbols": len(self._prices), "samples": self._samples, "matrix_sample": self._matrix[0]}
+
+
+risk_model = RiskModel(settings.risk_window_samples)
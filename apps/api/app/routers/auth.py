@@ -15,6 +15,7 @@ from ..database import get_db
 from ..models import Pet, RefreshToken, User, Wallet
 from ..schemas import LoginRequest, RefreshRequest, RegisterRequest, TokenResponse
 from ..services import grant_reward
+from ..write_queue import run_write
 
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -53,13 +54,16 @@ def login(payload: LoginRequest, db: Session = Depends(get_db)):
     if not user or not verify_password(payload.password, user.password_hash):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="invalid credentials")
 
-    access = create_access_token(user.id)
-    refresh, exp = create_refresh_token(user.id)
-    db.query(RefreshToken).filter(RefreshToken.user_id == user.id).delete()
-    db.add(RefreshToken(user_id=user.id, token=refresh, expires_at=exp))
+    user_id = user.id
+    access = create_access_token(user_id)
+    refresh, exp = create_refresh_token(user_id)
 
-    grant_reward(db, user.id, "daily_login", settings.reward_daily_login_xp, settings.reward_daily_login_coins, "daily", str(date.today()))
-    db.commit()
+    def execute(db: Session):
+        db.query(RefreshToken).filter(RefreshToken.user_id == user_id).delete()
+        db.add(RefreshToken(user_id=user_id, token=refresh, expires_at=exp))
+        grant_reward(db, user_id, "daily_login", settings.reward_daily_login_xp, settings.reward_daily_login_coins, "daily", str(date.today()))
+
+    run_write(db, execute, user_id)
     return TokenResponse(access_token=access, refresh_token=refresh)
 
 
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 
 from ..database import get_db
 from ..deps import current_user
-from ..models import Inventory, RewardEvent, ShopItem, User, Wallet
+from ..models import Inventory, ShopItem, User, Wallet
+from ..pagination import decode_cursor, encode_cursor
+from ..reward_ledger import reward_history_page
 from ..schemas import EquipRequest, PurchaseRequest
 
 
@@ -17,25 +19,25 @@ def rewards_balance(user: User = Depends(current_user), db: Session = Depends(ge
 
 
 @router.get("/rewards/history")
-def rewards_history(user: User = Depends(current_user), db: Session = Depends(get_db)):
-    rows = (
-        db.query(RewardEvent)
-        .filter(RewardEvent.user_id == user.id)
-        .order_by(RewardEvent.created_at.desc())
-        .limit(100)
-        .all()
-    )
-    return [
-        {
-            "source": row.source,
-            "xp_delta": row.xp_delta,
-            "coin_delta": row.coin_delta,
-            "ref_type": row.ref_type,
-            "ref_id": row.ref_id,
-            "created_at": row.created_at,
-        }
-        for row in rows
-    ]
+def rewards_history(
+    response: Response,
+    user: User = Depends(current_user),
+    db: Session = Depends(get_db),
+    cursor: str | None = None,
+    source: str | None = None,
+    limit: int = Query(default=100, ge=1, le=200),
+):
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+    items, next_key = reward_history_page(db, user.id, limit, source, after)
+    if next_key is not None:
+        response.headers["X-Next-Cursor"] = encode_cursor(*next_key)
+    return items
 
 
 @router.get("/shop/items")
@@ -0,0 +1,40 @@
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..deps import current_user, quote_deadline
+from ..leaderboard import current_leaderboard, leaderboard_cache
+from ..models import User
+from ..schemas import LeaderboardOut
+
+
+router = APIRouter(tags=["leaderboard"])
+
+
+@router.get("/leaderboard", response_model=LeaderboardOut)
+def leaderboard(
+    user: User = Depends(current_user),
+    db: Session = Depends(get_db),
+    deadline: float = Depends(quote_deadline),
+    by: Literal["value", "return"] = "value",
+    limit: int = Query(default=10, ge=1),
+):
+    try:
+        rankings = current_leaderboard(db, deadline)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
+    return {
+        "by": by,
+        "entries": [
+            {
+                "rank": entry["rank"],
+                "pet_name": entry["pet_name"],
+                "total_value": entry["total_value"],
+                "return_pct": entry["return_pct"],
+                "is_you": entry["user_id"] == user.id,
+            }
+            for entry in rankings[by][: min(limit, leaderboard_cache.size)]
+        ],
+    }
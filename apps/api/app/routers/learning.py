@@ -11,6 +11,7 @@ from ..deps import current_user
 from ..models import Lesson, LessonProgress, LessonQuestion, Pet, User
 from ..schemas import LessonCheckRequest, LessonListOut, LessonOut, LessonSubmitRequest
 from ..services import apply_hunger_decay, grant_reward, reward_hunger_for_lesson
+from ..write_queue import run_write
 
 
 router = APIRouter(prefix="/lessons", tags=["learning"])
@@ -120,49 +121,54 @@ def submit_lesson(
     ]
     selected_quiz = _selected_quiz_for_user(user.id, lesson.id, quiz_pool)
 
-    progress = (
-        db.query(LessonProgress)
-        .filter(LessonProgress.user_id == user.id, LessonProgress.lesson_id == lesson.id)
-        .first()
-    )
-    if not progress:
-        progress = LessonProgress(user_id=user.id, lesson_id=lesson.id)
-        db.add(progress)
-
-    correct = 0
-    for q in selected_quiz:
-        if payload.answers.get(q["id"]) == q["answer"]:
-            correct += 1
-    score = round((correct / max(1, len(selected_quiz))) * 100, 2)
-
-    progress.status = "completed"
-    progress.score = score
-    progress.completed_at = datetime.now(UTC).replace(tzinfo=None)
-
-    grant_reward(
-        db,
-        user.id,
-        "lesson_completion",
-        settings.reward_lesson_complete_xp,
-        settings.reward_lesson_complete_coins,
-        "lesson",
-        f"{lesson.id}:{payload.idempotency_key}",
-    )
-    if score == 100.0:
+    user_id = user.id
+
+    def execute(db: Session):
+        progress = (
+            db.query(LessonProgress)
+            .filter(LessonProgress.user_id == user_id, LessonProgress.lesson_id == lesson_id)
+            .first()
+        )
+        if not progress:
+            progress = LessonProgress(user_id=user_id, lesson_id=lesson_id)
+            db.add(progress)
+
+        correct = 0
+        for q in selected_quiz:
+            if payload.answers.get(q["id"]) == q["answer"]:
+                correct += 1
+        score = round((correct / max(1, len(selected_quiz))) * 100, 2)
+
+        progress.status = "completed"
+        progress.score = score
+        progress.completed_at = datetime.now(UTC).replace(tzinfo=None)
+
         grant_reward(
             db,
-            user.id,
-            "quiz_perfect",
-            settings.reward_quiz_perfect_xp,
-            settings.reward_quiz_perfect_coins,
-            "lesson_perfect",
-            f"{lesson.id}:{payload.idempotency_key}",
+            user_id,
+            "lesson_completion",
+            settings.reward_lesson_complete_xp,
+            settings.reward_lesson_complete_coins,
+            "lesson",
+            f"{lesson_id}:{payload.idempotency_key}",
         )
-
-    pet = db.query(Pet).filter(Pet.user_id == user.id).one()
-    apply_hunger_decay(pet)
-    reward_hunger_for_lesson(pet)
-    db.commit()
+        if score == 100.0:
+            grant_reward(
+                db,
+                user_id,
+                "quiz_perfect",
+                settings.reward_quiz_perfect_xp,
+                settings.reward_quiz_perfect_coins,
+                "lesson_perfect",
+                f"{lesson_id}:{payload.idempotency_key}",
+            )
+
+        pet = db.query(Pet).filter(Pet.user_id == user_id).one()
+        apply_hunger_decay(pet)
+        reward_hunger_for_lesson(pet)
+        return score
+
+    score = run_write(db, execute, user_id)
     return {"completed": True, "score": score}
 
 
@@ -1,18 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query
 
-from ..database import get_db
-from ..models import Asset
+from ..catalog import asset_catalog
+from ..deps import quote_deadline
 from ..schemas import AssetOut, QuoteOut
-from ..services import quote_for_asset
+from ..services import quotes_for_assets
 
 
 router = APIRouter(prefix="/market", tags=["market"])
 
 
 @router.get("/assets", response_model=list[AssetOut])
-def assets(db: Session = Depends(get_db)):
-    rows = db.query(Asset).filter(Asset.is_active.is_(True)).order_by(Asset.symbol.asc()).all()
+def assets(asset_type: str | None = Query(default=None, alias="type"), sector: str | None = None):
+    rows = asset_catalog.active()
+    if asset_type is not None:
+        rows = [row for row in asset_catalog.by_type(asset_type) if sector is None or row.sector == sector]
+    elif sector is not None:
+        rows = asset_catalog.by_sector(sector)
     return [
         {
             "symbol": row.symbol,
@@ -26,13 +29,10 @@ def assets(db: Session = Depends(get_db)):
 
 
 @router.get("/quotes", response_model=list[QuoteOut])
-def quotes(db: Session = Depends(get_db)):
-    rows = db.query(Asset).filter(Asset.is_active.is_(True)).all()
-    payload = []
-    for asset in rows:
-        try:
-            price, as_of = quote_for_asset(asset)
-        except RuntimeError as exc:
-            raise HTTPException(status_code=503, detail=str(exc)) from exc
-        payload.append({"symbol": asset.symbol, "price": price, "as_of": as_of})
-    return payload
+def quotes(deadline: float = Depends(quote_deadline)):
+    rows = asset_catalog.active()
+    try:
+        prices = quotes_for_assets(rows, deadline)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
+    return [{"symbol": asset.symbol, "price": prices[asset.symbol][0], "as_of": prices[asset.symbol][1]} for asset in rows]
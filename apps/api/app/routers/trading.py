@@ -1,93 +1,148 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
 from uuid import uuid4
 
+from ..catalog import asset_catalog
 from ..config import settings
 from ..database import get_db
-from ..deps import current_user
-from ..models import Asset, Position, Trade, User, Wallet
-from ..schemas import PortfolioOut, TradeRequest
-from ..services import grant_reward, portfolio_snapshot, quote_for_asset
+from ..deps import current_user, quote_deadline
+from ..equity import equity_history
+from ..models import Order, Position, SectorExposure, Trade, User, Wallet, utcnow
+from ..orders import order_book
+from ..pagination import decode_cursor, encode_cursor
+from ..schemas import (
+    BatchTradeRequest,
+    EquityPointOut,
+    OrderOut,
+    OrderRequest,
+    PortfolioOut,
+    SectorExposureOut,
+    TradePageOut,
+    TradeRequest,
+)
+from ..services import (
+    apply_buy,
+    apply_sell,
+    cached_portfolio_snapshot,
+    grant_reward,
+    grant_rewards,
+    quotes_for_assets,
+)
+from ..write_queue import run_write
 
 
 router = APIRouter(tags=["trading"])
 
 
+@router.get("/trades", response_model=TradePageOut)
+def trade_history(
+    user: User = Depends(current_user),
+    db: Session = Depends(get_db),
+    cursor: str | None = None,
+    symbol: str | None = None,
+    side: Literal["buy", "sell"] | None = None,
+    limit: int = Query(default=20, ge=1, le=100),
+):
+    query = db.query(Trade).filter(Trade.user_id == user.id)
+    if symbol:
+        query = query.filter(Trade.symbol == symbol.upper())
+    if side:
+        query = query.filter(Trade.side == side)
+    if cursor:
+        try:
+            executed_at, trade_id = decode_cursor(cursor)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc)) from exc
+        query = query.filter(tuple_(Trade.executed_at, Trade.id) < (executed_at, trade_id))
+
+    rows = query.order_by(Trade.executed_at.desc(), Trade.id.desc()).limit(limit + 1).all()
+    page = rows[:limit]
+    return {
+        "items": [
+            {
+                "id": row.id,
+                "symbol": row.symbol,
+                "side": row.side,
+                "qty": row.qty,
+                "price": row.price,
+                "executed_at": row.executed_at,
+            }
+            for row in page
+        ],
+        "next_cursor": encode_cursor(page[-1].executed_at, page[-1].id) if len(rows) > limit else None,
+    }
+
+
 @router.post("/trades/buy")
-def buy(payload: TradeRequest, user: User = Depends(current_user), db: Session = Depends(get_db)):
+def buy(
+    payload: TradeRequest,
+    user: User = Depends(current_user),
+    db: Session = Depends(get_db),
+    deadline: float = Depends(quote_deadline),
+):
     if not float(payload.quantity).is_integer():
         raise HTTPException(status_code=400, detail="quantity must be an integer")
     
-    asset = db.query(Asset).filter(Asset.symbol == payload.symbol.upper()).first()
+    asset = asset_catalog.get(payload.symbol.upper())
     if not asset:
         raise HTTPException(status_code=404, detail="asset not found")
 
     try:
-        price, _ = quote_for_asset(asset)
+        price, _ = quotes_for_assets([asset], deadline)[asset.symbol]
     except RuntimeError as exc:
         raise HTTPException(status_code=503, detail=str(exc)) from exc
 
     cost = round(price * payload.quantity, 2)
+    user_id = user.id
 
-    wallet = db.query(Wallet).filter(Wallet.user_id == user.id).one()
+    def execute(db: Session):
+        wallet = db.query(Wallet).filter(Wallet.user_id == user_id).one()
 
-    if wallet.cash_balance < cost:
-        raise HTTPException(status_code=400, detail="insufficient cash")
+        if wallet.cash_balance < cost:
+            raise HTTPException(status_code=400, detail="insufficient cash")
 
-    position = (
-        db.query(Position)
-        .filter(Position.user_id == user.id, Position.symbol == asset.symbol)
-        .first()
-    )
-
-    if not position:
-        position = Position(user_id=user.id, symbol=asset.symbol, quantity=0, avg_cost=0)
-        db.add(position)
-        db.flush()
-
-    total_old = position.quantity * position.avg_cost
-    total_new = total_old + cost
-    position.quantity += payload.quantity
-    position.avg_cost = round(total_new / position.quantity, 4)
-
-    wallet.cash_balance = round(wallet.cash_balance - cost, 2)
-
-    db.add(
-        Trade(
-            user_id=user.id,
-            symbol=asset.symbol,
-            side="buy",
-            qty=payload.quantity,
-            price=price,
+        position = (
+            db.query(Position)
+            .filter(Position.user_id == user_id, Position.symbol == asset.symbol)
+            .first()
         )
-    )
+        apply_buy(db, wallet, position, asset, payload.quantity, price)
 
-    grant_reward(
-        db,
-        user.id,
-        "trade",
-        settings.reward_trade_xp,
-        settings.reward_trade_coins,
-        "trade",
-        f"buy:{asset.symbol}:{uuid4().hex}",
-    )
+        grant_reward(
+            db,
+            user_id,
+            "trade",
+            settings.reward_trade_xp,
+            settings.reward_trade_coins,
+            "trade",
+            f"buy:{asset.symbol}:{uuid4().hex}",
+        )
+        return wallet.cash_balance
 
-    db.commit()
+    remaining_cash = run_write(db, execute, user_id)
 
     return {
         "ok": True,
         "symbol": asset.symbol,
         "price": price,
         "quantity": payload.quantity,
-        "remaining_cash": wallet.cash_balance,
+        "remaining_cash": remaining_cash,
     }
 
 
 @router.post("/trades/sell")
-def sell(payload: TradeRequest, user: User = Depends(current_user), db: Session = Depends(get_db)):
+def sell(
+    payload: TradeRequest,
+    user: User = Depends(current_user),
+    db: Session = Depends(get_db),
+    deadline: float = Depends(quote_deadline),
+):
     if not float(payload.quantity).is_integer():
         raise HTTPException(status_code=400, detail="quantity must be an integer")
-    asset = db.query(Asset).filter(Asset.symbol == payload.symbol.upper()).first()
+    asset = asset_catalog.get(payload.symbol.upper())
     if not asset:
         raise HTTPException(status_code=404, detail="asset not found")
 
@@ -100,35 +155,226 @@ def sell(payload: TradeRequest, user: User = Depends(current_user), db: Session
         raise HTTPException(status_code=400, detail="insufficient quantity")
 
     try:
-        price, _ = quote_for_asset(asset)
+        price, _ = quotes_for_assets([asset], deadline)[asset.symbol]
     except RuntimeError as exc:
         raise HTTPException(status_code=503, detail=str(exc)) from exc
-    proceeds = round(price * payload.quantity, 2)
-
-    wallet = db.query(Wallet).filter(Wallet.user_id == user.id).one()
-    wallet.cash_balance = round(wallet.cash_balance + proceeds, 2)
-
-    position.quantity -= payload.quantity
-    if position.quantity <= 0:
-        db.delete(position)
-
-    db.add(Trade(user_id=user.id, symbol=asset.symbol, side="sell", qty=payload.quantity, price=price))
-    grant_reward(
-        db,
-        user.id,
-        "trade",
-        settings.reward_trade_xp,
-        settings.reward_trade_coins,
-        "trade",
-        f"sell:{asset.symbol}:{uuid4().hex}",
-    )
-    db.commit()
+
+    user_id = user.id
+
+    def execute(db: Session):
+        position = (
+            db.query(Position)
+            .filter(Position.user_id == user_id, Position.symbol == asset.symbol)
+            .first()
+        )
+        if not position or position.quantity < payload.quantity:
+            raise HTTPException(status_code=400, detail="insufficient quantity")
+        wallet = db.query(Wallet).filter(Wallet.user_id == user_id).one()
+        apply_sell(db, wallet, position, asset, payload.quantity, price)
+        grant_reward(
+            db,
+            user_id,
+            "trade",
+            settings.reward_trade_xp,
+            settings.reward_trade_coins,
+            "trade",
+            f"sell:{asset.symbol}:{uuid4().hex}",
+        )
+
+    run_write(db, execute, user_id)
     return {"ok": True, "symbol": asset.symbol, "price": price, "quantity": payload.quantity}
 
 
+@router.post("/trades/batch")
+def batch(
+    payload: BatchTradeRequest,
+    user: User = Depends(current_user),
+    db: Session = Depends(get_db),
+    deadline: float = Depends(quote_deadline),
+):
+    assets = {}
+    for idx, leg in enumerate(payload.legs):
+        if not float(leg.quantity).is_integer():
+            raise HTTPException(status_code=400, detail=f"leg {idx}: quantity must be an integer")
+        asset = asset_catalog.get(leg.symbol.upper())
+        if not asset:
+            raise HTTPException(status_code=404, detail=f"leg {idx}: asset not found")
+        assets[asset.symbol] = asset
+
+    try:
+        prices = quotes_for_assets(assets.values(), deadline)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=503, detail=str(exc)) from exc
+
+    user_id = user.id
+
+    def execute(db: Session):
+        wallet = db.query(Wallet).filter(Wallet.user_id == user_id).one()
+        positions = {
+            position.symbol: position
+            for position in db.query(Position).filter(Position.user_id == user_id, Position.symbol.in_(assets))
+        }
+
+        cash = wallet.cash_balance
+        holdings = {symbol: position.quantity for symbol, position in positions.items()}
+        for idx, leg in enumerate(payload.legs):
+            symbol = leg.symbol.upper()
+            amount = round(prices[symbol][0] * leg.quantity, 2)
+            if leg.side == "buy":
+                if cash < amount:
+                    raise HTTPException(status_code=400, detail=f"leg {idx}: insufficient cash")
+                cash = round(cash - amount, 2)
+                holdings[symbol] = holdings.get(symbol, 0) + leg.quantity
+            else:
+                if holdings.get(symbol, 0) < leg.quantity:
+                    raise HTTPException(status_code=400, detail=f"leg {idx}: insufficient quantity")
+                cash = round(cash + amount, 2)
+                holdings[symbol] -= leg.quantity
+
+        fills = []
+        rewards = []
+        for leg in payload.legs:
+            asset = assets[leg.symbol.upper()]
+            price = prices[asset.symbol][0]
+            if leg.side == "buy":
+                positions[asset.symbol] = apply_buy(db, wallet, positions.get(asset.symbol), asset, leg.quantity, price)
+            else:
+                apply_sell(db, wallet, positions[asset.symbol], asset, leg.quantity, price)
+                if positions[asset.symbol].quantity <= 0:
+                    del positions[asset.symbol]
+            fills.append({"side": leg.side, "symbol": asset.symbol, "price": price, "quantity": leg.quantity})
+            rewards.append(
+                (
+                    "trade",
+                    settings.reward_trade_xp,
+                    settings.reward_trade_coins,
+                    "trade",
+                    f"{leg.side}:{asset.symbol}:{uuid4().hex}",
+                )
+            )
+
+        grant_rewards(db, user_id, rewards)
+        return fills, wallet.cash_balance
+
+    fills, remaining_cash = run_write(db, execute, user_id)
+    return {"ok": True, "fills": fills, "remaining_cash": remaining_cash}
+
+
+def _order_out(order: Order) -> dict:
+    return {
+        "id": order.id,
+        "side": order.side,
+        "order_type": order.order_type,
+        "symbol": order.symbol,
+        "quantity": order.quantity,
+        "trigger_price": order.trigger_price,
+        "status": order.status,
+        "fill_price": order.fill_price,
+        "reason": order.reason,
+        "created_at": order.created_at,
+        "closed_at": order.closed_at,
+    }
+
+
+@router.post("/orders", response_model=OrderOut)
+def place_order(payload: OrderRequest, user: User = Depends(current_user), db: Session = Depends(get_db)):
+    if not float(payload.quantity).is_integer():
+        raise HTTPException(status_code=400, detail="quantity must be an integer")
+    asset = asset_catalog.get(payload.symbol.upper())
+    if not asset:
+        raise HTTPException(status_code=404, detail="asset not found")
+    open_orders = (
+        db.query(Order.id)
+        .filter(Order.user_id == user.id, Order.status == "open")
+        .limit(settings.max_open_orders_per_user)
+        .count()
+    )
+    if open_orders >= settings.max_open_orders_per_user:
+        raise HTTPException(status_code=400, detail="too many open orders")
+    user_id = user.id
+
+    def execute(db: Session):
+        order = Order(
+            user_id=user_id,
+            symbol=asset.symbol,
+            side=payload.side,
+            order_type=payload.order_type,
+            quantity=payload.quantity,
+            trigger_price=payload.trigger_price,
+            status="open",
+        )
+        db.add(order)
+        db.flush()
+        return _order_out(order)
+
+    order = run_write(db, execute, user_id)
+    order_book.add(order["id"], order["symbol"], order["side"], order["order_type"], order["trigger_price"])
+    return order
+
+
+@router.get("/orders", response_model=list[OrderOut])
+def list_orders(
+    user: User = Depends(current_user),
+    db: Session = Depends(get_db),
+    status: Literal["open", "filled", "cancelled", "rejected"] | None = None,
+    limit: int = Query(default=50, ge=1, le=200),
+):
+    query = db.query(Order).filter(Order.user_id == user.id)
+    if status:
+        query = query.filter(Order.status == status)
+    return [_order_out(order) for order in query.order_by(Order.id.desc()).limit(limit)]
+
+
+@router.delete("/orders/{order_id}", response_model=OrderOut)
+def cancel_order(order_id: int, user: User = Depends(current_user), db: Session = Depends(get_db)):
+    user_id = user.id
+
+    def execute(db: Session):
+        order = db.query(Order).filter(Order.id == order_id, Order.user_id == user_id).first()
+        if not order:
+            raise HTTPException(status_code=404, detail="order not found")
+        if order.status != "open":
+            raise HTTPException(status_code=400, detail=f"order is {order.status}")
+        order.status = "cancelled"
+        order.closed_at = utcnow()
+        return _order_out(order)
+
+    order = run_write(db, execute, user_id)
+    order_book.discard(order_id)
+    return order
+
+
 @router.get("/portfolio", response_model=PortfolioOut)
-def portfolio(user: User = Depends(current_user), db: Session = Depends(get_db)):
+def portfolio(
+    user: User = Depends(current_user),
+    db: Session = Depends(get_db),
+    deadline: float = Depends(quote_deadline),
+):
     try:
-        return portfolio_snapshot(db, user.id)
+        return cached_portfolio_snapshot(db, user.id, deadline)
     except RuntimeError as exc:
         raise HTTPException(status_code=503, detail=str(exc)) from exc
+
+
+@router.get("/portfolio/history", response_model=list[EquityPointOut])
+def portfolio_history(
+    user: User = Depends(current_user),
+    db: Session = Depends(get_db),
+    days: int = Query(default=30, ge=1, le=3650),
+    points: int = Query(default=120, ge=2, le=1000),
+):
+    return equity_history(db, user.id, days, points)
+
+
+@router.get("/portfolio/sectors", response_model=list[SectorExposureOut])
+def portfolio_sectors(user: User = Depends(current_user), db: Session = Depends(get_db)):
+    rows = (
+        db.query(SectorExposure)
+        .filter(SectorExposure.user_id == user.id, SectorExposure.position_count > 0)
+        .order_by(SectorExposure.cost_basis.desc())
+        .all()
+    )
+    return [
+        {"sector": row.sector, "cost_basis": round(row.cost_basis, 2), "position_count": row.position_count}
+        for row in rows
+    ]
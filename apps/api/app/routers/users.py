@@ -1,23 +1,27 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.orm import Session
 
+from ..config import settings
 from ..database import get_db
 from ..deps import current_user
 from ..models import User, Wallet, Pet
 from ..schemas import MeOut, PetOut
-from ..services import apply_hunger_decay
+from ..services import hunger_after_decay
 # from ..services import pet_equipped_items
 
 router = APIRouter(tags=["users"])
 
 
+def _current_hunger(pet: Pet) -> int:
+    if not settings.hunger_read_correction:
+        return pet.hunger
+    return hunger_after_decay(pet.hunger, pet.last_hunger_tick)
+
+
 @router.get("/me", response_model=MeOut)
 def me(user: User = Depends(current_user), db: Session = Depends(get_db)):
     wallet = db.query(Wallet).filter(Wallet.user_id == user.id).one()
     pet = db.query(Pet).filter(Pet.user_id == user.id).one()
-    if apply_hunger_decay(pet):
-        db.commit()
-        db.refresh(pet)
 
     return {
         "email": user.email,
@@ -30,7 +34,7 @@ def me(user: User = Depends(current_user), db: Session = Depends(get_db)):
             "level": pet.level,
             "xp_current": pet.xp_current,
             "stage": pet.stage,
-            "hunger": pet.hunger,
+            "hunger": _current_hunger(pet),
             "equipped_items": [],
         },
     }
@@ -45,7 +49,7 @@ def get_pet(user: User = Depends(current_user), db: Session = Depends(get_db)):
         "level": pet.level,
         "xp_current": pet.xp_current,
         "stage": pet.stage,
-        "hunger": pet.hunger,
+        "hunger": _current_hunger(pet),
         # "equipped_items": pet_equipped_items(db, user.id),
         "equipped_items": [],
     }
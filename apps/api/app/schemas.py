@@ -1,4 +1,6 @@
-from datetime import datetime
+from datetime import date, datetime
+from typing import Literal
+
 from pydantic import BaseModel, EmailStr, Field
 
 
@@ -28,6 +30,52 @@ class TradeRequest(BaseModel):
     quantity: float = Field(gt=0)
 
 
+class TradeLeg(BaseModel):
+    side: Literal["buy", "sell"]
+    symbol: str
+    quantity: float = Field(gt=0)
+
+
+class BatchTradeRequest(BaseModel):
+    legs: list[TradeLeg] = Field(min_length=1, max_length=50)
+
+
+class OrderRequest(BaseModel):
+    side: Literal["buy", "sell"]
+    order_type: Literal["limit", "stop"]
+    symbol: str
+    quantity: float = Field(gt=0)
+    trigger_price: float = Field(gt=0)
+
+
+class OrderOut(BaseModel):
+    id: int
+    side: str
+    order_type: str
+    symbol: str
+    quantity: float
+    trigger_price: float
+    status: str
+    fill_price: float | None
+    reason: str | None
+    created_at: datetime
+    closed_at: datetime | None
+
+
+class TradeOut(BaseModel):
+    id: int
+    symbol: str
+    side: str
+    qty: float
+    price: float
+    executed_at: datetime
+
+
+class TradePageOut(BaseModel):
+    items: list[TradeOut]
+    next_cursor: str | None
+
+
 class LessonSubmitRequest(BaseModel):
     answers: dict[str, str]
     idempotency_key: str
@@ -79,14 +127,49 @@ class PositionOut(BaseModel):
     allocation_pct: float
 
 
+class PortfolioRiskOut(BaseModel):
+    volatility_pct: float
+    diversification_ratio: float
+    effective_positions: float
+    samples: int
+
+
 class PortfolioOut(BaseModel):
     cash: float
     total_value: float
     total_pl: float
     diversification_score: float
+    risk: PortfolioRiskOut | None = None
     positions: list[PositionOut]
 
 
+class SectorExposureOut(BaseModel):
+    sector: str
+    cost_basis: float
+    position_count: int
+
+
+class EquityPointOut(BaseModel):
+    day: date
+    cash: float
+    market_value: float
+    total_value: float
+    total_pl: float
+
+
+class LeaderboardEntryOut(BaseModel):
+    rank: int
+    pet_name: str
+    total_value: float
+    return_pct: float
+    is_you: bool
+
+
+class LeaderboardOut(BaseModel):
+    by: str
+    entries: list[LeaderboardEntryOut]
+
+
 class LessonOut(BaseModel):
     id: int
     title: str
@@ -1,6 +1,7 @@
 import json
 from pathlib import Path
 
+from .catalog import asset_catalog
 from .models import Asset, Lesson, LessonQuestion, ShopItem
 
 
@@ -141,3 +142,4 @@ def seed_if_needed(db):
             )
 
     db.commit()
+    asset_catalog.invalidate()
@@ -1,15 +1,29 @@
+from bisect import bisect_right
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from datetime import UTC, datetime, timezone
 import hashlib
 import logging
-from time import time
+from threading import Lock
+from time import monotonic, time
+from typing import Callable, Iterable
 
-import httpx
+from sqlalchemy import and_, update
+from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm import Session
 
+from .aggregates import adjust_aggregates, seed_aggregates
+from .catalog import asset_catalog
 from .config import settings
-from .models import Asset, Inventory, Pet, Position, RewardEvent, ShopItem, Wallet
+from .database import dialect_insert
+from .models import Asset, Inventory, PortfolioAggregate, Pet, Position, RewardEvent, ShopItem, Trade, Wallet, utcnow
+from .portfolio_cache import PortfolioCache
+from .quote_cache import QuoteCache, build_shared_quote_store
+from .quote_client import provider_breaker, provider_client
+from .reward_ledger import compacted_reward_keys
+from .risk import risk_model
 
 # Hunger constant
+HUNGER_MAX = 100
 HUNGER_DECAY_PER_DAY = 10
 HUNGER_REWARD_PER_LESSON = 20
 
@@ -22,7 +36,14 @@ STAGE_BY_LEVEL = {
 }
 
 logger = logging.getLogger(__name__)
-_quote_cache: dict[str, tuple[float, float]] = {}
+_quote_cache = QuoteCache(
+    settings.quote_cache_max_entries,
+    settings.quote_failure_backoff_seconds,
+    settings.quote_failure_backoff_max_seconds,
+)
+_shared_quotes = build_shared_quote_store()
+_portfolio_cache = PortfolioCache(settings.portfolio_cache_max_entries)
+_simulated_snapshot: tuple[str, dict[tuple[str, float], float]] = ("", {})
 FINNHUB_CRYPTO_SYMBOL_MAP = {
     "BTC": "BINANCE:BTCUSDT",
     "ETH": "BINANCE:ETHUSDT",
@@ -32,73 +53,299 @@ FINNHUB_CRYPTO_SYMBOL_MAP = {
 }
 
 
+class SingleFlight:
+    def __init__(self):
+        self._lock = Lock()
+        self._inflight: dict[str, Future] = {}
+        self.calls = 0
+        self.deduplicated = 0
+
+    def do(self, key: str, func: Callable[[], object]):
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+                self.calls += 1
+            else:
+                self.deduplicated += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = func()
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def in_flight(self, key: str) -> bool:
+        with self._lock:
+            return key in self._inflight
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"calls": self.calls, "deduplicated": self.deduplicated, "in_flight": len(self._inflight)}
+
+
+_quote_flight = SingleFlight()
+_quote_executor = ThreadPoolExecutor(max_workers=settings.price_fetch_concurrency, thread_name_prefix="quote-fetch")
+
+
+class LevelTable:
+    def __init__(self, thresholds: list[int], stages: dict[int, str]):
+        self.thresholds = sorted(thresholds)
+        self._stage_levels = sorted(stages)
+        self._stage_names = [stages[level] for level in self._stage_levels]
+
+    def level(self, total_xp: int) -> tuple[int, int]:
+        level = max(1, bisect_right(self.thresholds, total_xp))
+        return level, max(0, total_xp - self.thresholds[level - 1])
+
+    def stage(self, level: int) -> str:
+        idx = bisect_right(self._stage_levels, level)
+        return self._stage_names[idx - 1] if idx else "egg"
+
+
+level_table = LevelTable(LEVEL_THRESHOLDS, STAGE_BY_LEVEL)
+
+
 def stage_for_level(level: int) -> str:
-    stage = "egg"
-    for milestone, name in sorted(STAGE_BY_LEVEL.items()):
-        if level >= milestone:
-            stage = name
-    return stage
+    return level_table.stage(level)
 
 
 def compute_level(total_xp: int) -> tuple[int, int]:
-    level = 1
-    for idx, threshold in enumerate(LEVEL_THRESHOLDS, start=1):
-        if total_xp >= threshold:
-            level = idx
-    current_threshold = LEVEL_THRESHOLDS[min(level - 1, len(LEVEL_THRESHOLDS) - 1)]
-    xp_current = max(0, total_xp - current_threshold)
-    return level, xp_current
+    return level_table.level(total_xp)
+
+
+def quote_for_asset(asset: Asset, deadline: float | None = None) -> tuple[float, datetime]:
+    return quotes_for_assets([asset], deadline)[asset.symbol]
 
 
-def quote_for_asset(asset: Asset) -> tuple[float, datetime]:
+def quotes_for_assets(
+    assets: Iterable[Asset], deadline: float | None = None, strict: bool = True
+) -> dict[str, tuple[float, datetime]]:
+    assets = list(assets)
+    quotes: dict[str, tuple[float, datetime]] = {}
+    unavailable: set[str] = set()
+
     if settings.price_mode in {"finnhub", "hybrid"}:
-        finnhub_symbol = _finnhub_symbol_for_asset(asset)
-        live = _quote_from_finnhub(finnhub_symbol)
-        if live is not None:
-            return round(live, 2), datetime.now(timezone.utc).replace(tzinfo=None)
-        if settings.price_mode == "finnhub":
-            raise RuntimeError(f"live quote unavailable for {asset.symbol}")
+        live = _quotes_from_finnhub([_finnhub_symbol_for_asset(asset) for asset in assets], deadline)
+        for asset in assets:
+            cached = live.get(_finnhub_symbol_for_asset(asset))
+            if cached is not None:
+                price, fetched_at = cached
+                quotes[asset.symbol] = (round(price, 2), _as_of(fetched_at))
+            elif settings.price_mode == "finnhub":
+                if strict:
+                    raise RuntimeError(f"live quote unavailable for {asset.symbol}")
+                unavailable.add(asset.symbol)
+
+    simulated = [asset for asset in assets if asset.symbol not in quotes and asset.symbol not in unavailable]
+    if simulated:
+        now = datetime.now(timezone.utc)
+        prices = _simulated_prices(simulated, now)
+        as_of = now.replace(tzinfo=None)
+        for asset in simulated:
+            quotes[asset.symbol] = (prices[asset.symbol], as_of)
+    return quotes
+
+
+def sample_risk_prices(assets: Iterable[Asset]) -> bool:
+    quotes = quotes_for_assets(assets, strict=False)
+    recorded = risk_model.record(price_snapshot_id(), {symbol: price for symbol, (price, _) in quotes.items()})
+    risk_model.refresh()
+    return recorded
+
+
+def refresh_live_quotes(assets: Iterable[Asset]) -> int:
+    if settings.price_mode not in {"finnhub", "hybrid"} or not settings.finnhub_api_key:
+        return 0
+
+    symbols = list(dict.fromkeys(_finnhub_symbol_for_asset(asset) for asset in assets))
+    _load_shared_quotes(symbols, settings.price_refresh_interval_seconds)
+    now_ts = time()
+    symbols = [
+        symbol
+        for symbol in symbols
+        if not _quote_cache.is_suppressed(symbol)
+        and (now_ts - (_quote_cache.peek(symbol) or (0.0, 0.0))[1]) >= settings.price_refresh_interval_seconds
+    ]
+    if not symbols:
+        return 0
+    futures = [_quote_executor.submit(_coalesced_finnhub_fetch, symbol) for symbol in symbols]
+    done, _ = wait(futures, timeout=settings.price_fetch_deadline_seconds)
+    refreshed = sum(1 for future in done if future.result() is not None)
+    if refreshed < len(symbols):
+        logger.warning("quote refresh updated %d of %d symbols; serving last good prices", refreshed, len(symbols))
+    return refreshed
 
-    return _simulated_quote(asset)
+
+def market_snapshot_id(now: datetime | None = None) -> str:
+    return (now or datetime.now(timezone.utc)).strftime("%Y%m%d%H%M")
+
+
+def price_snapshot_id() -> str:
+    snapshot_id = market_snapshot_id()
+    if settings.price_mode in {"finnhub", "hybrid"}:
+        snapshot_id += f":{int(time() // max(1, settings.price_cache_ttl_seconds))}"
+    return snapshot_id
 
 
 def _simulated_quote(asset: Asset) -> tuple[float, datetime]:
     now = datetime.now(timezone.utc)
-    minute_bucket = now.strftime("%Y%m%d%H%M")
-    digest = hashlib.sha256(f"{asset.symbol}:{minute_bucket}".encode()).hexdigest()
-    drift_seed = int(digest[:8], 16)
-    change = ((drift_seed % 1201) - 600) / 10000.0
-    price = max(0.5, round(asset.base_price * (1 + change), 2))
-    return price, now.replace(tzinfo=None)
+    return _simulated_prices([asset], now)[asset.symbol], now.replace(tzinfo=None)
+
+
+def _simulated_prices(assets: list[Asset], now: datetime) -> dict[str, float]:
+    global _simulated_snapshot
+    bucket = market_snapshot_id(now)
+    snapshot = _simulated_snapshot
+    if snapshot[0] != bucket:
+        snapshot = (bucket, {})
+
+    prices = snapshot[1]
+    missing = [(asset.symbol, asset.base_price) for asset in assets if (asset.symbol, asset.base_price) not in prices]
+    if missing:
+        seeds = [int(hashlib.sha256(f"{symbol}:{bucket}".encode()).hexdigest()[:8], 16) for symbol, _ in missing]
+        prices = {
+            **prices,
+            **{
+                key: max(0.5, round(key[1] * (1 + ((seed % 1201) - 600) / 10000.0), 2))
+                for key, seed in zip(missing, seeds)
+            },
+        }
+        snapshot = (bucket, prices)
+    _simulated_snapshot = snapshot
+    return {asset.symbol: prices[(asset.symbol, asset.base_price)] for asset in assets}
+
+
+def _as_of(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+
+def _load_shared_quotes(symbols: list[str], fresh_for: float):
+    if _shared_quotes is None:
+        return
+    now_ts = time()
+    outdated = [symbol for symbol in symbols if (now_ts - (_quote_cache.peek(symbol) or (0.0, 0.0))[1]) >= fresh_for]
+    for symbol, quote in _shared_quotes.get_many(outdated).items():
+        _quote_cache.put(symbol, quote)
+
+
+def _cached_finnhub_quote(symbol: str) -> tuple[str, tuple[float, float] | None]:
+    state, quote = _quote_cache.lookup(symbol, settings.price_cache_ttl_seconds, settings.price_max_staleness_seconds)
+    if state == "stale" and not _quote_cache.is_suppressed(symbol):
+        _revalidate_in_background(symbol)
+    return state, quote
 
 
-def _quote_from_finnhub(symbol: str) -> float | None:
+def _revalidate_in_background(symbol: str):
+    if not _quote_flight.in_flight(symbol):
+        _quote_executor.submit(_coalesced_finnhub_fetch, symbol)
+
+
+def _store_finnhub_quote(symbol: str, quote: tuple[float, float]):
+    _quote_cache.put(symbol, quote)
+    if _shared_quotes is not None:
+        _shared_quotes.put(symbol, *quote)
+
+
+def _quote_from_finnhub(symbol: str) -> tuple[float, float] | None:
     if not settings.finnhub_api_key:
         return None
 
-    now_ts = time()
-    cached = _quote_cache.get(symbol)
-    if cached and (now_ts - cached[1]) < settings.price_cache_ttl_seconds:
-        return cached[0]
+    _load_shared_quotes([symbol], settings.price_cache_ttl_seconds)
+    state, quote = _cached_finnhub_quote(symbol)
+    if state == "miss":
+        return _coalesced_finnhub_fetch(symbol)
+    return quote
+
+
+def _coalesced_finnhub_fetch(symbol: str) -> tuple[float, float] | None:
+    return _quote_flight.do(symbol, lambda: _fetch_finnhub_quote(symbol))
+
+
+def quote_fetch_stats() -> dict:
+    return _quote_flight.stats()
+
 
+def quote_cache_stats() -> dict:
+    return _quote_cache.stats()
+
+
+def _fetch_finnhub_quote(symbol: str) -> tuple[float, float] | None:
+    if not provider_breaker.allow():
+        return None
+
+    now_ts = time()
     try:
-        response = httpx.get(
-            f"{settings.finnhub_base_url}/quote",
-            params={"symbol": symbol, "token": settings.finnhub_api_key},
-            timeout=4.0,
-        )
+        response = provider_client.get("/quote", params={"symbol": symbol, "token": settings.finnhub_api_key})
         response.raise_for_status()
+    except Exception as exc:
+        provider_breaker.record_failure()
+        _quote_cache.record_failure(symbol)
+        logger.warning("finnhub request failed for %s: %s", symbol, exc)
+        return None
+
+    provider_breaker.record_success()
+    try:
         payload = response.json()
         current_price = payload.get("c")
         if isinstance(current_price, (int, float)) and current_price > 0:
-            price = float(current_price)
-            _quote_cache[symbol] = (price, now_ts)
-            return price
+            quote = (float(current_price), now_ts)
+            _store_finnhub_quote(symbol, quote)
+            return quote
+        logger.warning("finnhub returned no price for %s", symbol)
     except Exception as exc:
         logger.warning("finnhub request failed for %s: %s", symbol, exc)
+    _quote_cache.record_failure(symbol)
     return None
 
 
+def _quotes_from_finnhub(symbols: list[str], deadline: float | None = None) -> dict[str, tuple[float, float]]:
+    if not settings.finnhub_api_key or not symbols:
+        return {}
+
+    symbols = list(dict.fromkeys(symbols))
+    _load_shared_quotes(symbols, settings.price_cache_ttl_seconds)
+    quotes = {}
+    misses = []
+    for symbol in symbols:
+        state, quote = _cached_finnhub_quote(symbol)
+        if quote is not None:
+            quotes[symbol] = quote
+        elif state == "miss":
+            misses.append(symbol)
+    if not misses:
+        return quotes
+
+    if deadline is None:
+        deadline = monotonic() + settings.price_fetch_deadline_seconds
+    remaining = deadline - monotonic()
+    if remaining <= 0:
+        logger.warning("latency budget spent before fetching %d live quotes", len(misses))
+        return quotes
+
+    futures = {_quote_executor.submit(_coalesced_finnhub_fetch, symbol): symbol for symbol in misses}
+    done, pending = wait(futures, timeout=remaining)
+    if pending:
+        logger.warning("finnhub deadline expired with %d of %d quotes pending", len(pending), len(misses))
+
+    for future in done:
+        quote = future.result()
+        if quote is not None:
+            quotes[futures[future]] = quote
+    return quotes
+
+
 def _finnhub_symbol_for_asset(asset: Asset) -> str:
     if asset.type == "crypto":
         return FINNHUB_CRYPTO_SYMBOL_MAP.get(asset.symbol, asset.symbol)
@@ -106,88 +353,172 @@ def _finnhub_symbol_for_asset(asset: Asset) -> str:
 
 
 def grant_reward(db: Session, user_id: int, source: str, xp: int, coins: int, ref_type: str, ref_id: str):
-    exists = (
-        db.query(RewardEvent)
-        .filter(
-            RewardEvent.user_id == user_id,
-            RewardEvent.source == source,
-            RewardEvent.ref_type == ref_type,
-            RewardEvent.ref_id == ref_id,
+    grant_rewards(db, user_id, [(source, xp, coins, ref_type, ref_id)])
+
+
+def grant_rewards(db: Session, user_id: int, grants: list[tuple[str, int, int, str, str]]):
+    compacted = compacted_reward_keys(db, user_id, [(source, ref_type, ref_id) for source, _, _, ref_type, ref_id in grants])
+    grants = [grant for grant in grants if (grant[0], grant[3], grant[4]) not in compacted]
+    if not grants:
+        return
+    inserted = db.execute(
+        dialect_insert(db, RewardEvent)
+        .values(
+            [
+                {
+                    "user_id": user_id,
+                    "source": source,
+                    "xp_delta": xp,
+                    "coin_delta": coins,
+                    "ref_type": ref_type,
+                    "ref_id": ref_id,
+                    "created_at": utcnow(),
+                }
+                for source, xp, coins, ref_type, ref_id in grants
+            ]
         )
-        .first()
-    )
-    if exists:
+        .on_conflict_do_nothing()
+        .returning(RewardEvent.xp_delta, RewardEvent.coin_delta)
+    ).all()
+    if not inserted:
         return
 
-    wallet = db.query(Wallet).filter(Wallet.user_id == user_id).one()
-    wallet.xp_total += xp
-    wallet.coins_balance += coins
-
-    pet = db.query(Pet).filter(Pet.user_id == user_id).one()
-    new_level, xp_current = compute_level(wallet.xp_total)
-    pet.level = new_level
-    pet.xp_current = xp_current
-    pet.stage = stage_for_level(new_level)
-
-    db.add(
-        RewardEvent(
-            user_id=user_id,
-            source=source,
-            xp_delta=xp,
-            coin_delta=coins,
-            ref_type=ref_type,
-            ref_id=ref_id,
+    xp_total = db.execute(
+        update(Wallet)
+        .where(Wallet.user_id == user_id)
+        .values(
+            xp_total=Wallet.xp_total + sum(row.xp_delta for row in inserted),
+            coins_balance=Wallet.coins_balance + sum(row.coin_delta for row in inserted),
         )
+        .returning(Wallet.xp_total)
+    ).scalar_one()
+
+    new_level, xp_current = compute_level(xp_total)
+    db.execute(
+        update(Pet)
+        .where(Pet.user_id == user_id)
+        .values(level=new_level, xp_current=xp_current, stage=stage_for_level(new_level))
     )
 
 
-def portfolio_snapshot(db: Session, user_id: int) -> dict:
-    wallet = db.query(Wallet).filter(Wallet.user_id == user_id).one()
-    positions = db.query(Position).filter(Position.user_id == user_id).all()
-
-    line_items = []
-    invested_total = 0.0
-    market_total = 0.0
-
-    for position in positions:
-        if position.quantity <= 0:
-            continue
-        asset = db.query(Asset).filter(Asset.symbol == position.symbol).one()
-        price, _ = quote_for_asset(asset)
-        market_value = round(position.quantity * price, 2)
-        cost_value = round(position.quantity * position.avg_cost, 2)
-        unrealized_pl = round(market_value - cost_value, 2)
-        invested_total += cost_value
-        market_total += market_value
-        line_items.append(
-            {
-                "symbol": position.symbol,
-                "quantity": position.quantity,
-                "avg_cost": round(position.avg_cost, 2),
-                "market_price": price,
-                "market_value": market_value,
-                "unrealized_pl": unrealized_pl,
-            }
-        )
+def apply_buy(db: Session, wallet: Wallet, position: Position | None, asset: Asset, quantity: float, price: float) -> Position:
+    seed_aggregates(db, wallet.user_id, asset.sector)
+    if position is None:
+        position = Position(user_id=wallet.user_id, symbol=asset.symbol, quantity=0, avg_cost=0)
+        db.add(position)
+        db.flush()
+
+    cost = round(price * quantity, 2)
+    opened = position.quantity <= 0
+    total_old = position.quantity * position.avg_cost
+    position.quantity += quantity
+    position.avg_cost = round((total_old + cost) / position.quantity, 4)
+
+    wallet.cash_balance = round(wallet.cash_balance - cost, 2)
+    wallet.portfolio_version += 1
+    db.add(Trade(user_id=wallet.user_id, symbol=asset.symbol, side="buy", qty=quantity, price=price))
+    adjust_aggregates(db, wallet.user_id, asset.sector, position.quantity * position.avg_cost - total_old, 1 if opened else 0)
+    return position
+
 
-    total_value = round(wallet.cash_balance + market_total, 2)
+def apply_sell(db: Session, wallet: Wallet, position: Position, asset: Asset, quantity: float, price: float):
+    seed_aggregates(db, wallet.user_id, asset.sector)
+    proceeds = round(price * quantity, 2)
+    released = quantity * position.avg_cost
+
+    wallet.cash_balance = round(wallet.cash_balance + proceeds, 2)
+    wallet.portfolio_version += 1
+
+    position.quantity -= quantity
+    closed = position.quantity <= 0
+    if closed:
+        db.delete(position)
+        db.flush([position])
+
+    db.add(Trade(user_id=wallet.user_id, symbol=asset.symbol, side="sell", qty=quantity, price=price))
+    adjust_aggregates(db, wallet.user_id, asset.sector, -released, -1 if closed else 0)
+
+
+def portfolio_snapshot(db: Session, user_id: int, deadline: float | None = None) -> dict:
+    rows = (
+        db.query(
+            Wallet.cash_balance,
+            PortfolioAggregate.cost_basis,
+            Position.symbol,
+            Position.quantity,
+            Position.avg_cost,
+        )
+        .outerjoin(PortfolioAggregate, PortfolioAggregate.user_id == Wallet.user_id)
+        .outerjoin(Position, and_(Position.user_id == Wallet.user_id, Position.quantity > 0))
+        .filter(Wallet.user_id == user_id)
+        .order_by(Position.id.asc())
+        .all()
+    )
+    if not rows:
+        raise NoResultFound(f"no wallet for user {user_id}")
+
+    cash = rows[0].cash_balance
+    positions = [row for row in rows if row.symbol is not None]
+    quotes = quotes_for_assets([asset_catalog.get(row.symbol) for row in positions], deadline)
+
+    prices = [quotes[row.symbol][0] for row in positions]
+    market_values = [round(row.quantity * price, 2) for row, price in zip(positions, prices)]
+    cost_values = [round(row.quantity * row.avg_cost, 2) for row in positions]
+    market_total = sum(market_values)
+    invested_total = rows[0].cost_basis if rows[0].cost_basis is not None else sum(cost_values)
+    total_value = round(cash + market_total, 2)
     total_pl = round(market_total - invested_total, 2)
 
-    for item in line_items:
-        item["allocation_pct"] = round((item["market_value"] / total_value) * 100, 2) if total_value > 0 else 0
+    line_items = [
+        {
+            "symbol": row.symbol,
+            "quantity": row.quantity,
+            "avg_cost": round(row.avg_cost, 2),
+            "market_price": price,
+            "market_value": market_value,
+            "unrealized_pl": round(market_value - cost_value, 2),
+            "allocation_pct": round((market_value / total_value) * 100, 2) if total_value > 0 else 0,
+        }
+        for row, price, market_value, cost_value in zip(positions, prices, market_values, cost_values)
+    ]
 
-    concentration = max([i["allocation_pct"] for i in line_items], default=0)
-    diversification = round(max(0, 100 - concentration), 2)
+    risk = None
+    if total_value > 0 and positions:
+        weights = {row.symbol: market_value / total_value for row, market_value in zip(positions, market_values)}
+        risk = risk_model.portfolio_risk(weights)
+    if risk is not None:
+        invested_pct = market_total / total_value * 100
+        diversification = round(min(100, max(0, 100 - invested_pct / risk["effective_positions"])), 2)
+    else:
+        concentration = max([i["allocation_pct"] for i in line_items], default=0)
+        diversification = round(max(0, 100 - concentration), 2)
 
     return {
-        "cash": round(wallet.cash_balance, 2),
+        "cash": round(cash, 2),
         "total_value": total_value,
         "total_pl": total_pl,
         "diversification_score": diversification,
+        "risk": risk,
         "positions": line_items,
     }
 
 
+def cached_portfolio_snapshot(db: Session, user_id: int, deadline: float | None = None) -> dict:
+    version = db.query(Wallet.portfolio_version).filter(Wallet.user_id == user_id).scalar()
+    snapshot_id = price_snapshot_id()
+    cached = _portfolio_cache.get(user_id, version, snapshot_id)
+    if cached is not None:
+        return cached
+
+    snapshot = portfolio_snapshot(db, user_id, deadline)
+    _portfolio_cache.put(user_id, version, snapshot_id, snapshot)
+    return snapshot
+
+
+def portfolio_cache_stats() -> dict:
+    return _portfolio_cache.stats()
+
+
 def pet_equipped_items(db: Session, user_id: int) -> list[dict]:
     rows = (
         db.query(Inventory, ShopItem)
@@ -206,14 +537,20 @@ def pet_equipped_items(db: Session, user_id: int) -> list[dict]:
         for _, item in rows
     ]
 
+def hunger_after_decay(hunger: int, last_tick: datetime, now: datetime | None = None) -> int:
+    now = now or datetime.now(UTC).replace(tzinfo=None)
+    days_passed = (now.date() - last_tick.date()).days
+    if days_passed <= 0:
+        return hunger
+    return max(0, hunger - (days_passed * HUNGER_DECAY_PER_DAY))
+
+
 def apply_hunger_decay(pet) -> bool:
     now = datetime.now(UTC).replace(tzinfo=None)
-    last = pet.last_hunger_tick
-    days_passed = (now.date() - last.date()).days
-    if days_passed <= 0:
+    if (now.date() - pet.last_hunger_tick.date()).days <= 0:
         return False
 
-    pet.hunger = max(0, pet.hunger - (days_passed * HUNGER_DECAY_PER_DAY))
+    pet.hunger = hunger_after_decay(pet.hunger, pet.last_hunger_tick, now)
     pet.last_hunger_tick = now
     return True
 
@@ -221,6 +558,6 @@ def apply_hunger_decay(pet) -> bool:
 def reward_hunger_for_lesson(pet) -> bool:
     now = datetime.now(UTC).replace(tzinfo=None)
     before = pet.hunger
-    pet.hunger = min(100, pet.hunger + HUNGER_REWARD_PER_LESSON)
+    pet.hunger = min(HUNGER_MAX, pet.hunger + HUNGER_REWARD_PER_LESSON)
     pet.last_hunger_tick = now
     return pet.hunger != before
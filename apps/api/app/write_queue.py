@@ -0,0 +1,163 @@
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, TypeVar
+
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+
+from .config import settings
+from .database import SessionLocal
+from .locks import user_locks
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class GroupCommitWriter:
+    def __init__(self, session_factory: Callable[[], Session], max_batch: int, max_wait_seconds: float):
+        self.session_factory = session_factory
+        self.max_batch = max(1, max_batch)
+        self.max_wait_seconds = max(0.0, max_wait_seconds)
+        self._queue: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.units = 0
+        self.failed_units = 0
+        self.max_batch_seen = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self._thread = threading.Thread(target=self._run, name="group-commit-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float | None = 5.0):
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._queue.put(None)
+            thread.join(timeout)
+            self._thread = None
+
+    def submit(self, func: Callable[[Session], T]) -> T:
+        if not self.running:
+            raise RuntimeError("write queue is not running")
+        future: Future = Future()
+        self._queue.put((func, future))
+        return future.result()
+
+    def _collect(self, first) -> tuple[list, bool]:
+        units = [first]
+        stopping = False
+        wait = self.max_wait_seconds
+        while len(units) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=wait) if wait > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                stopping = True
+                break
+            units.append(item)
+        return units, stopping
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            units, stopping = self._collect(first)
+            self._commit_group(units)
+            if stopping:
+                break
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self._commit_group([item])
+
+    def _commit_group(self, units: list):
+        done = []
+        with self.session_factory() as db:
+            try:
+                if db.get_bind().dialect.name == "sqlite":
+                    db.connection().exec_driver_sql("BEGIN IMMEDIATE")
+                for func, future in units:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with db.begin_nested():
+                            result = func(db)
+                    except BaseException as exc:
+                        self.failed_units += 1
+                        future.set_exception(exc)
+                        continue
+                    done.append((future, result))
+                db.commit()
+            except Exception as exc:
+                logger.exception("group commit of %s writes failed", len(units))
+                db.rollback()
+                for future, _ in done:
+                    future.set_exception(exc)
+                for func, future in units:
+                    if not future.done():
+                        future.set_exception(exc)
+                return
+        self.batches += 1
+        self.units += len(units)
+        self.max_batch_seen = max(self.max_batch_seen, len(units))
+        for future, result in done:
+            future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.running,
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+            "units": self.units,
+            "failed_units": self.failed_units,
+            "max_batch_size": self.max_batch_seen,
+            "avg_batch_size": round(self.units / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+write_queue = GroupCommitWriter(SessionLocal, settings.write_batch_max, settings.write_batch_wait_ms / 1000)
+
+
+def _run_write_once(db: Session, func: Callable[[Session], T]) -> T:
+    if not write_queue.running:
+        result = func(db)
+        db.commit()
+        return result
+    db.rollback()
+    return write_queue.submit(func)
+
+
+def run_write(db: Session, func: Callable[[Session], T], user_id: int | None = None) -> T:
+    if user_id is None:
+        return _run_write_once(db, func)
+    attempt = 0
+    while True:
+        try:
+            if write_queue.running:
+                return _run_write_once(db, func)
+            with user_locks.hold(user_id):
+                return _run_write_once(db, func)
+        except StaleDataError:
+            db.rollback()
+            if attempt >= settings.write_conflict_retries:
+                raise
+            attempt += 1
@@ -1,7 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import UTC, datetime, timedelta
+import gzip
+import json
 import os
+from threading import Barrier
+from time import time
 
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm.exc import StaleDataError
 
 os.environ["DATABASE_URL"] = "sqlite:///./test_investipet.db"
 
@@ -9,13 +18,58 @@ DB_PATH = "test_investipet.db"
 if os.path.exists(DB_PATH):
     os.remove(DB_PATH)
 
+from app.database import SessionLocal, engine, upgrade_schema  # noqa: E402
 from app.main import app  # noqa: E402
+from app import aggregates, services  # noqa: E402
+from app.aggregates import reconcile_aggregates  # noqa: E402
+from app.catalog import asset_catalog  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.equity import record_equity_snapshots  # noqa: E402
+from app.leaderboard import leaderboard_cache  # noqa: E402
+from app.hunger import decay_pet_hunger  # noqa: E402
+from app.leveling import relevel_pets  # noqa: E402
+from app.models import (  # noqa: E402
+    EquitySnapshot,
+    Pet,
+    PortfolioAggregate,
+    Position,
+    RewardEvent,
+    RewardRollup,
+    SectorExposure,
+    Wallet,
+)
+from app.orders import OrderBook, match_orders, order_book  # noqa: E402
+from app.reward_ledger import compact_reward_events  # noqa: E402
+from app.risk import RiskModel  # noqa: E402
+from app.services import portfolio_snapshot  # noqa: E402
+from app.locks import user_locks  # noqa: E402
+from app.write_queue import write_queue  # noqa: E402
 
 
 def auth_headers(token: str):
     return {"Authorization": f"Bearer {token}"}
 
 
+def register(client: TestClient, email: str) -> str:
+    reg = client.post("/auth/register", json={"email": email, "password": "strongpass123", "pet_name": "Milo"})
+    assert reg.status_code == 200
+    return reg.json()["access_token"]
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
 @pytest.fixture
 def client():
     with TestClient(app) as test_client:
@@ -64,3 +118,645 @@ def test_full_mvp_flow(client: TestClient):
 
     shop = client.get("/shop/items", headers=auth_headers(access))
     assert shop.status_code == 503
+
+
+def test_market_assets_filters_from_catalog(client: TestClient):
+    crypto = client.get("/market/assets", params={"type": "crypto"})
+    assert crypto.status_code == 200
+    assert {row["symbol"] for row in crypto.json()} == {"BTC", "ETH", "SOL", "ADA", "DOGE"}
+
+    tech_stocks = client.get("/market/assets", params={"type": "stock", "sector": "Technology"})
+    assert all(row["sector"] == "Technology" for row in tech_stocks.json())
+    assert len(tech_stocks.json()) == 5
+
+
+def test_portfolio_snapshot_uses_one_query(client: TestClient):
+    access = register(client, "valuation@example.com")
+    for symbol in ("AAPL", "MSFT", "SOL", "KO"):
+        assert client.post("/trades/buy", headers=auth_headers(access), json={"symbol": symbol, "quantity": 1}).status_code == 200
+
+    with SessionLocal() as db:
+        user_id = db.execute(text("SELECT id FROM users WHERE email = 'valuation@example.com'")).scalar_one()
+        with count_queries() as statements:
+            snapshot = portfolio_snapshot(db, user_id)
+
+    assert len(statements) == 1
+    assert [item["symbol"] for item in snapshot["positions"]] == ["AAPL", "MSFT", "SOL", "KO"]
+
+
+def test_portfolio_cache_is_invalidated_by_trades(client: TestClient, monkeypatch):
+    monkeypatch.setattr(services, "price_snapshot_id", lambda: "fixed-minute")
+    access = register(client, "cache@example.com")
+    headers = auth_headers(access)
+
+    first = client.get("/portfolio", headers=headers).json()
+    hits_before = client.get("/metrics").json()["portfolio_cache"]["hits"]
+    assert client.get("/portfolio", headers=headers).json() == first
+    assert client.get("/metrics").json()["portfolio_cache"]["hits"] == hits_before + 1
+
+    assert client.post("/trades/buy", headers=headers, json={"symbol": "KO", "quantity": 1}).status_code == 200
+    after_trade = client.get("/portfolio", headers=headers).json()
+    assert [item["symbol"] for item in after_trade["positions"]] == ["KO"]
+
+
+def test_portfolio_aggregates_follow_trades(client: TestClient):
+    access = register(client, "aggregates@example.com")
+    headers = auth_headers(access)
+    for symbol, quantity in (("AAPL", 3), ("MSFT", 2), ("JPM", 4)):
+        assert client.post("/trades/buy", headers=headers, json={"symbol": symbol, "quantity": quantity}).status_code == 200
+    assert client.post("/trades/sell", headers=headers, json={"symbol": "AAPL", "quantity": 1}).status_code == 200
+    assert client.post("/trades/sell", headers=headers, json={"symbol": "JPM", "quantity": 4}).status_code == 200
+
+    sectors = client.get("/portfolio/sectors", headers=headers).json()
+    assert [(row["sector"], row["position_count"]) for row in sectors] == [("Technology", 2)]
+
+    with SessionLocal() as db:
+        assert reconcile_aggregates(db) == []
+
+
+def test_aggregates_seed_from_pre_trade_state_on_closing_sell(client: TestClient):
+    headers = auth_headers(register(client, "aggregates-seed@example.com"))
+    for symbol, quantity in (("AAPL", 2), ("KO", 3)):
+        assert client.post("/trades/buy", headers=headers, json={"symbol": symbol, "quantity": quantity}).status_code == 200
+    with SessionLocal() as db:
+        user_id = db.query(Wallet.user_id).order_by(Wallet.user_id.desc()).limit(1).scalar()
+        db.query(PortfolioAggregate).filter(PortfolioAggregate.user_id == user_id).delete()
+        db.query(SectorExposure).filter(SectorExposure.user_id == user_id).delete()
+        db.commit()
+
+    assert client.post("/trades/sell", headers=headers, json={"symbol": "AAPL", "quantity": 2}).status_code == 200
+
+    with SessionLocal() as db:
+        assert [row for row in reconcile_aggregates(db) if row["user_id"] == user_id] == []
+        aggregate = db.get(PortfolioAggregate, user_id)
+        ko = db.query(Position).filter(Position.user_id == user_id, Position.symbol == "KO").one()
+        assert aggregate.position_count == 1
+        assert abs(aggregate.cost_basis - ko.quantity * ko.avg_cost) < 0.01
+
+
+def test_reconciler_repairs_from_positions_read_under_the_user_lock(client: TestClient, monkeypatch):
+    headers = auth_headers(register(client, "aggregates-repair@example.com"))
+    assert client.post("/trades/buy", headers=headers, json={"symbol": "AAPL", "quantity": 1}).status_code == 200
+    with SessionLocal() as db:
+        user_id = db.query(Wallet.user_id).order_by(Wallet.user_id.desc()).limit(1).scalar()
+        db.query(PortfolioAggregate).filter(PortfolioAggregate.user_id == user_id).update({PortfolioAggregate.cost_basis: 1.0})
+        db.commit()
+
+    repair = aggregates.repair_user_aggregates
+
+    def trade_then_repair(db, repaired_user_id):
+        assert client.post("/trades/buy", headers=headers, json={"symbol": "MSFT", "quantity": 2}).status_code == 200
+        repair(db, repaired_user_id)
+
+    monkeypatch.setattr(aggregates, "repair_user_aggregates", trade_then_repair)
+    with SessionLocal() as db:
+        mismatches = reconcile_aggregates(db, fix=True)
+        assert {(row["kind"], row["user_id"]) for row in mismatches} >= {("portfolio", user_id)}
+        assert [row for row in reconcile_aggregates(db) if row["user_id"] == user_id] == []
+        assert db.get(PortfolioAggregate, user_id).position_count == 2
+    assert settings.aggregate_reconcile_fix is False
+
+
+def test_batch_trades_apply_atomically(client: TestClient):
+    access = register(client, "batch@example.com")
+    headers = auth_headers(access)
+
+    rejected = client.post(
+        "/trades/batch",
+        headers=headers,
+        json={"legs": [{"side": "buy", "symbol": "KO", "quantity": 2}, {"side": "sell", "symbol": "PFE", "quantity": 1}]},
+    )
+    assert rejected.status_code == 400
+    assert rejected.json()["detail"] == "leg 1: insufficient quantity"
+    assert client.get("/portfolio", headers=headers).json()["positions"] == []
+
+    xp_before = client.get("/rewards/balance", headers=headers).json()["xp_total"]
+    accepted = client.post(
+        "/trades/batch",
+        headers=headers,
+        json={
+            "legs": [
+                {"side": "buy", "symbol": "KO", "quantity": 3},
+                {"side": "buy", "symbol": "PFE", "quantity": 2},
+                {"side": "sell", "symbol": "KO", "quantity": 3},
+                {"side": "buy", "symbol": "KO", "quantity": 1},
+            ]
+        },
+    )
+    assert accepted.status_code == 200
+    assert len(accepted.json()["fills"]) == 4
+
+    holdings = {item["symbol"]: item["quantity"] for item in client.get("/portfolio", headers=headers).json()["positions"]}
+    assert holdings == {"KO": 1, "PFE": 2}
+    assert client.get("/rewards/balance", headers=headers).json()["xp_total"] == xp_before + 40
+
+    with SessionLocal() as db:
+        assert reconcile_aggregates(db) == []
+
+
+def test_trade_history_pages_with_cursor(client: TestClient):
+    access = register(client, "history@example.com")
+    headers = auth_headers(access)
+    for symbol in ("KO", "PFE", "KO", "WMT", "KO"):
+        assert client.post("/trades/buy", headers=headers, json={"symbol": symbol, "quantity": 1}).status_code == 200
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/trades", headers=headers, params=params).json()
+        seen.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == 5
+    assert seen == sorted(seen, reverse=True)
+
+    ko = client.get("/trades", headers=headers, params={"symbol": "ko", "side": "buy"}).json()
+    assert [item["symbol"] for item in ko["items"]] == ["KO", "KO", "KO"]
+    assert client.get("/trades", headers=headers, params={"cursor": "not-a-cursor"}).status_code == 400
+
+
+def test_write_queue_commits_groups_and_reports_each_result(client: TestClient, monkeypatch):
+    monkeypatch.setattr(write_queue, "max_wait_seconds", 0.05)
+    headers = auth_headers(register(client, "writer@example.com"))
+    write_queue.start()
+    try:
+        def trade(args):
+            side, quantity = args
+            return client.post(f"/trades/{side}", headers=headers, json={"symbol": "KO", "quantity": quantity})
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            buys = list(pool.map(trade, [("buy", 1)] * 8))
+        assert [response.status_code for response in buys] == [200] * 8
+
+        rejected = trade(("buy", 100000))
+        assert rejected.status_code == 400
+        assert rejected.json()["detail"] == "insufficient cash"
+        assert trade(("sell", 3)).status_code == 200
+        stats = write_queue.stats()
+    finally:
+        write_queue.stop()
+
+    assert stats["units"] == 10
+    assert stats["failed_units"] == 1
+    assert stats["batches"] < stats["units"]
+    holdings = {item["symbol"]: item["quantity"] for item in client.get("/portfolio", headers=headers).json()["positions"]}
+    assert holdings == {"KO": 5}
+    with SessionLocal() as db:
+        assert reconcile_aggregates(db) == []
+
+
+def test_queued_writes_do_not_wait_on_the_user_stripe_lock(client: TestClient):
+    headers = auth_headers(register(client, "writer-unlocked@example.com"))
+    with SessionLocal() as db:
+        user_id = db.query(Wallet.user_id).order_by(Wallet.user_id.desc()).limit(1).scalar()
+    write_queue.start()
+    try:
+        with ThreadPoolExecutor(max_workers=1) as pool, user_locks.hold(user_id):
+            pending = pool.submit(client.post, "/trades/buy", headers=headers, json={"symbol": "KO", "quantity": 1})
+            assert pending.result(timeout=5).status_code == 200
+    finally:
+        write_queue.stop()
+
+
+def test_same_user_trades_are_serialized_and_versioned(client: TestClient):
+    headers = auth_headers(register(client, "striped@example.com"))
+    cash_before = client.get("/me", headers=headers).json()["cash_balance"]
+
+    def buy(_):
+        return client.post("/trades/buy", headers=headers, json={"symbol": "KO", "quantity": 1})
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        fills = list(pool.map(buy, range(8)))
+    assert [response.status_code for response in fills] == [200] * 8
+
+    spent = round(sum(response.json()["price"] for response in fills), 2)
+    assert client.get("/me", headers=headers).json()["cash_balance"] == pytest.approx(cash_before - spent)
+    holdings = {item["symbol"]: item["quantity"] for item in client.get("/portfolio", headers=headers).json()["positions"]}
+    assert holdings == {"KO": 8}
+
+    with SessionLocal() as stale, SessionLocal() as fresh:
+        wallet = stale.query(Wallet).order_by(Wallet.user_id.desc()).first()
+        user_id = wallet.user_id
+        fresh_wallet = fresh.get(Wallet, user_id)
+        fresh_wallet.cash_balance += 1
+        fresh.commit()
+        wallet.cash_balance -= 1
+        with pytest.raises(StaleDataError):
+            stale.commit()
+
+
+def test_leaderboard_ranks_all_portfolios_once_per_snapshot(client: TestClient, monkeypatch):
+    leaderboard_cache.clear()
+    monkeypatch.setattr("app.leaderboard.price_snapshot_id", lambda: "snapshot-1")
+    rich = auth_headers(register(client, "leader@example.com"))
+    assert client.post("/trades/buy", headers=rich, json={"symbol": "SOL", "quantity": 5}).status_code == 200
+
+    with count_queries() as statements:
+        first = client.get("/leaderboard", headers=rich, params={"limit": 500})
+        second = client.get("/leaderboard", headers=rich, params={"by": "return"})
+    assert first.status_code == 200 and second.status_code == 200
+    assert len([sql for sql in statements if "positions" in sql]) == 1
+
+    entries = first.json()["entries"]
+    assert [entry["rank"] for entry in entries] == list(range(1, len(entries) + 1))
+    values = [entry["total_value"] for entry in entries]
+    assert values == sorted(values, reverse=True)
+    assert sum(entry["is_you"] for entry in entries) == 1
+    assert second.json()["by"] == "return"
+    assert len(second.json()["entries"]) <= 10
+
+
+def test_equity_snapshots_are_upserted_and_downsampled(client: TestClient):
+    headers = auth_headers(register(client, "equity@example.com"))
+    assert client.post("/trades/buy", headers=headers, json={"symbol": "KO", "quantity": 2}).status_code == 200
+    with SessionLocal() as db:
+        user_id = db.query(Wallet.user_id).order_by(Wallet.user_id.desc()).limit(1).scalar()
+        today = datetime.now(UTC).date()
+        for offset in range(1, 60):
+            db.add(
+                EquitySnapshot(
+                    user_id=user_id,
+                    day=today - timedelta(days=offset),
+                    cash=10000.0,
+                    market_value=float(offset),
+                    cost_basis=0.0,
+                )
+            )
+        db.commit()
+        recorded = record_equity_snapshots(db, chunk_size=2)
+        assert recorded == db.query(Wallet).count()
+        assert record_equity_snapshots(db, chunk_size=3) == recorded
+        assert db.query(EquitySnapshot).filter(EquitySnapshot.day == today).count() == recorded
+
+    full = client.get("/portfolio/history", headers=headers, params={"days": 365, "points": 1000}).json()
+    assert len(full) == 60
+    assert full[-1]["day"] == today.isoformat()
+    assert full[-1]["market_value"] > 0
+
+    sampled = client.get("/portfolio/history", headers=headers, params={"days": 365, "points": 12}).json()
+    assert len(sampled) == 12
+    assert sampled[0]["day"] == full[0]["day"] and sampled[-1]["day"] == full[-1]["day"]
+    assert len(client.get("/portfolio/history", headers=headers, params={"days": 7}).json()) == 7
+
+
+def test_equity_snapshots_value_unquoted_symbols_at_cost_in_live_mode(client: TestClient, monkeypatch):
+    headers = auth_headers(register(client, "equity-live@example.com"))
+    assert client.post("/trades/buy", headers=headers, json={"symbol": "KO", "quantity": 2}).status_code == 200
+    monkeypatch.setattr(settings, "price_mode", "finnhub")
+    monkeypatch.setattr(settings, "finnhub_api_key", "test-key")
+    monkeypatch.setattr(services, "_fetch_finnhub_quote", lambda symbol: None)
+    with SessionLocal() as db:
+        user_id = db.query(Wallet.user_id).order_by(Wallet.user_id.desc()).limit(1).scalar()
+        assert record_equity_snapshots(db) == db.query(Wallet).count()
+        snapshot = (
+            db.query(EquitySnapshot)
+            .filter(EquitySnapshot.user_id == user_id, EquitySnapshot.day == datetime.now(UTC).date())
+            .one()
+        )
+    assert snapshot.market_value == snapshot.cost_basis > 0
+
+
+def test_resting_orders_fill_only_when_crossed(client: TestClient):
+    headers = auth_headers(register(client, "orders@example.com"))
+    order_book.clear()
+
+    def place(side, order_type, quantity, trigger_price):
+        response = client.post(
+            "/orders",
+            headers=headers,
+            json={"side": side, "order_type": order_type, "symbol": "KO", "quantity": quantity, "trigger_price": trigger_price},
+        )
+        assert response.status_code == 200
+        return response.json()["id"]
+
+    buy_limit = place("buy", "limit", 3, 1_000_000)
+    buy_stop = place("buy", "stop", 1, 1_000_000)
+    sell_limit = place("sell", "limit", 1, 0.01)
+    sell_stop = place("sell", "stop", 1, 0.01)
+    too_big = place("sell", "limit", 50, 0.01)
+    assert order_book.stats()["open"] == 5
+
+    with SessionLocal() as db:
+        assert match_orders(db) == 2
+        assert match_orders(db) == 0
+
+    orders = {order["id"]: order for order in client.get("/orders", headers=headers).json()}
+    assert orders[buy_limit]["status"] == "filled"
+    assert orders[sell_limit]["status"] == "filled"
+    assert orders[too_big]["status"] == "rejected"
+    assert orders[too_big]["reason"] == "insufficient quantity"
+    assert orders[buy_stop]["status"] == "open" and orders[sell_stop]["status"] == "open"
+    assert order_book.stats()["open"] == 2
+
+    assert client.delete(f"/orders/{buy_stop}", headers=headers).json()["status"] == "cancelled"
+    assert client.delete(f"/orders/{buy_stop}", headers=headers).status_code == 400
+    assert [order["id"] for order in client.get("/orders", headers=headers, params={"status": "open"}).json()] == [sell_stop]
+
+    holdings = {item["symbol"]: item["quantity"] for item in client.get("/portfolio", headers=headers).json()["positions"]}
+    assert holdings == {"KO": 2}
+    with SessionLocal() as db:
+        assert reconcile_aggregates(db) == []
+
+
+def test_order_books_drop_orders_closed_by_another_worker(client: TestClient):
+    headers = auth_headers(register(client, "orders-sync@example.com"))
+    other_worker = OrderBook()
+    with SessionLocal() as db:
+        other_worker.sync(db)
+    baseline = other_worker.stats()["open"]
+
+    placed = []
+    for idx in range(6):
+        response = client.post(
+            "/orders",
+            headers=headers,
+            json={"side": "buy", "order_type": "limit", "symbol": "MSFT", "quantity": 1, "trigger_price": 0.01 + idx},
+        )
+        placed.append(response.json()["id"])
+    with SessionLocal() as db:
+        other_worker.sync(db)
+    assert other_worker.stats()["open"] == baseline + 6
+    assert "MSFT" in other_worker.symbols()
+
+    for order_id in placed:
+        assert client.delete(f"/orders/{order_id}", headers=headers).json()["status"] == "cancelled"
+    with SessionLocal() as db:
+        other_worker.sync(db)
+    stats = other_worker.stats()
+    assert stats["open"] == baseline
+    assert "MSFT" not in other_worker.symbols()
+    assert stats["heap_entries"] <= 2 * stats["open"]
+
+
+def test_diversification_score_accounts_for_correlation(client: TestClient, monkeypatch):
+    headers = auth_headers(register(client, "risk@example.com"))
+    for symbol in ("KO", "PFE"):
+        assert client.post("/trades/buy", headers=headers, json={"symbol": symbol, "quantity": 2}).status_code == 200
+    with SessionLocal() as db:
+        user_id = db.query(Wallet.user_id).order_by(Wallet.user_id.desc()).limit(1).scalar()
+
+    def model_with(ko, pfe):
+        model = RiskModel(window=10)
+        for idx, (ko_price, pfe_price) in enumerate(zip(ko, pfe)):
+            model.record(f"sample-{idx}", {"KO": ko_price, "PFE": pfe_price})
+        model.refresh()
+        return model
+
+    ko = [60.0, 61.2, 59.8, 62.0, 60.5, 63.1]
+    correlated = model_with(ko, [price / 2 for price in ko])
+    assert correlated.correlation("KO", "PFE") == pytest.approx(1.0)
+    monkeypatch.setattr(services, "risk_model", correlated)
+    with SessionLocal() as db:
+        same_bet = portfolio_snapshot(db, user_id)
+    assert same_bet["risk"]["effective_positions"] == pytest.approx(1.0)
+    invested_pct = sum(item["market_value"] for item in same_bet["positions"]) / same_bet["total_value"] * 100
+    assert same_bet["diversification_score"] == pytest.approx(100 - invested_pct, abs=0.01)
+
+    monkeypatch.setattr(services, "risk_model", model_with(ko, [30.0, 29.4, 30.9, 29.8, 30.6, 29.1]))
+    with SessionLocal() as db:
+        hedged = portfolio_snapshot(db, user_id)
+    assert hedged["risk"]["effective_positions"] > 1.5
+    assert hedged["diversification_score"] > same_bet["diversification_score"]
+
+    monkeypatch.setattr(services, "risk_model", RiskModel(window=10))
+    fallback = client.get("/portfolio", headers=headers).json()
+    assert fallback["risk"] is None
+    assert fallback["diversification_score"] == round(100 - max(item["allocation_pct"] for item in fallback["positions"]), 2)
+
+
+def test_risk_sampler_records_the_quotes_that_arrived(monkeypatch):
+    model = RiskModel(window=10)
+    monkeypatch.setattr(services, "risk_model", model)
+    monkeypatch.setattr(settings, "price_mode", "finnhub")
+    monkeypatch.setattr(settings, "finnhub_api_key", "test-key")
+    def flaky(symbol: str):
+        return None if symbol == "KO" else (100.0, time())
+
+    monkeypatch.setattr(services, "_fetch_finnhub_quote", flaky)
+    services._quote_cache.clear()
+    assets = [asset_catalog.get("AAPL"), asset_catalog.get("KO")]
+    assert services.sample_risk_prices(assets)
+    assert model.stats()["symbols"] == 1
+    services._quote_cache.clear()
+
+
+def test_reward_grants_use_fixed_statements_and_dedup_index(client: TestClient, tmp_path, caplog):
+    headers = auth_headers(register(client, "ledger@example.com"))
+    balance = client.get("/rewards/balance", headers=headers).json()
+    with SessionLocal() as db:
+        user_id = db.query(Wallet.user_id).order_by(Wallet.user_id.desc()).limit(1).scalar()
+        with count_queries() as statements:
+            services.grant_reward(db, user_id, "bonus", 30, 5, "promo", "spring")
+        assert len(statements) == 4
+        with count_queries() as statements:
+            services.grant_rewards(db, user_id, [("bonus", 30, 5, "promo", "spring")] * 2)
+        assert len(statements) == 2
+        db.commit()
+    after = client.get("/rewards/balance", headers=headers).json()
+    assert after["xp_total"] == balance["xp_total"] + 30
+    assert after["coins_balance"] == balance["coins_balance"] + 5
+
+    legacy = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with legacy.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE reward_events (id INTEGER PRIMARY KEY, user_id INTEGER, source VARCHAR, xp_delta INTEGER,"
+                " coin_delta INTEGER, ref_type VARCHAR, ref_id VARCHAR, created_at DATETIME)"
+            )
+        )
+        for ref_id in ("'x'", "'x'", "NULL", "NULL"):
+            conn.execute(
+                text(
+                    "INSERT INTO reward_events (user_id, source, xp_delta, coin_delta, ref_type, ref_id)"
+                    f" VALUES (1, 'trade', 10, 10, 'trade', {ref_id})"
+                )
+            )
+    with caplog.at_level("WARNING", logger="app.database"):
+        upgrade_schema(legacy)
+    assert "removed 1 duplicate reward_events rows" in caplog.text
+    with legacy.connect() as conn:
+        assert conn.execute(text("SELECT id FROM reward_events ORDER BY id")).scalars().all() == [1, 3, 4]
+
+
+def test_reward_history_pages_with_cursor_header(client: TestClient):
+    headers = auth_headers(register(client, "history-rewards@example.com"))
+    with SessionLocal() as db:
+        user_id = db.query(Wallet.user_id).order_by(Wallet.user_id.desc()).limit(1).scalar()
+        services.grant_rewards(db, user_id, [("bonus", 1, 1, "promo", str(idx)) for idx in range(7)])
+        db.commit()
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 3, "source": "bonus", **({"cursor": cursor} if cursor else {})}
+        page = client.get("/rewards/history", headers=headers, params=params)
+        assert page.status_code == 200
+        seen.extend(item["ref_id"] for item in page.json())
+        cursor = page.headers.get("x-next-cursor")
+        if cursor is None:
+            break
+    assert sorted(seen) == [str(idx) for idx in range(7)]
+    assert len(client.get("/rewards/history", headers=headers).json()) == 8
+    assert client.get("/rewards/history", headers=headers, params={"cursor": "bogus"}).status_code == 400
+
+    with engine.connect() as conn:
+        plan = " ".join(
+            str(row[-1])
+            for row in conn.execute(
+                text(
+                    "EXPLAIN QUERY PLAN SELECT id, user_id, source, xp_delta, coin_delta, ref_type, ref_id, created_at"
+                    " FROM reward_events WHERE user_id = 1 AND source = 'bonus' ORDER BY created_at DESC, id DESC LIMIT 4"
+                )
+            )
+        )
+    assert "COVERING INDEX ix_reward_events_history_covering" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_old_reward_events_roll_up_without_breaking_history_or_dedup(client: TestClient, tmp_path):
+    headers = auth_headers(register(client, "cold@example.com"))
+    with SessionLocal() as db:
+        user_id = db.query(Wallet.user_id).order_by(Wallet.user_id.desc()).limit(1).scalar()
+        services.grant_rewards(db, user_id, [("trade", 10, 10, "trade", f"old-{idx}") for idx in range(5)])
+        services.grant_reward(db, user_id, "lesson_completion", 40, 50, "lesson", "1:retry-key")
+        db.flush()
+        old = datetime(2020, 1, 1, 12)
+        db.query(RewardEvent).filter(RewardEvent.user_id == user_id, RewardEvent.source != "daily_login").update(
+            {RewardEvent.created_at: old}
+        )
+        db.commit()
+        xp_before = db.get(Wallet, user_id).xp_total
+
+        assert compact_reward_events(db, cutoff=datetime(2021, 1, 1), archive_dir=str(tmp_path), chunk_size=4) == 6
+        assert db.query(RewardEvent).filter(RewardEvent.created_at < datetime(2021, 1, 1)).count() == 0
+        rollups = {row.source: (row.event_count, row.xp_total) for row in db.query(RewardRollup).filter(RewardRollup.user_id == user_id)}
+        assert rollups == {"trade": (5, 50), "lesson_completion": (1, 40)}
+
+        services.grant_reward(db, user_id, "lesson_completion", 40, 50, "lesson", "1:retry-key")
+        db.commit()
+        assert db.get(Wallet, user_id).xp_total == xp_before
+
+    archived = []
+    for path in sorted(tmp_path.glob("reward-events-*.ndjson.gz")):
+        with gzip.open(path, "rt") as handle:
+            archived.extend(json.loads(line)["ref_id"] for line in handle)
+    assert sorted(archived) == sorted([f"old-{idx}" for idx in range(5)] + ["1:retry-key"])
+
+    pages = []
+    cursor = None
+    while True:
+        params = {"limit": 1, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/rewards/history", headers=headers, params=params)
+        pages.extend(response.json())
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            break
+    assert [(item["source"], item["ref_type"]) for item in pages] == [
+        ("daily_login", "daily"),
+        ("lesson_completion", "rollup"),
+        ("trade", "rollup"),
+    ]
+    assert sum(item["event_count"] for item in pages) == 7
+
+
+def test_concurrent_compactors_claim_each_reward_event_once(client: TestClient, tmp_path):
+    register(client, "cold-race@example.com")
+    with SessionLocal() as db:
+        user_id = db.query(Wallet.user_id).order_by(Wallet.user_id.desc()).limit(1).scalar()
+        services.grant_rewards(db, user_id, [("race", 10, 2, "race", str(idx)) for idx in range(50)])
+        db.flush()
+        db.query(RewardEvent).filter(RewardEvent.user_id == user_id, RewardEvent.source == "race").update(
+            {RewardEvent.created_at: datetime(2020, 2, 2, 12)}
+        )
+        db.commit()
+
+    barrier = Barrier(2)
+
+    def compact():
+        with SessionLocal() as db:
+            barrier.wait()
+            return compact_reward_events(db, cutoff=datetime(2021, 1, 1), archive_dir=str(tmp_path), chunk_size=7)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        counts = [future.result() for future in [pool.submit(compact) for _ in range(2)]]
+    assert sum(counts) >= 50
+
+    with SessionLocal() as db:
+        rollup = db.query(RewardRollup).filter(RewardRollup.user_id == user_id, RewardRollup.source == "race").one()
+        assert (rollup.event_count, rollup.xp_total, rollup.coin_total) == (50, 500, 100)
+
+    archived = []
+    for path in tmp_path.glob("reward-events-*.ndjson.gz"):
+        with gzip.open(path, "rt") as handle:
+            archived.extend(record["ref_id"] for record in map(json.loads, handle) if record["source"] == "race")
+    assert sorted(archived, key=int) == [str(idx) for idx in range(50)]
+
+
+def test_relevel_job_applies_retuned_thresholds_to_every_pet(client: TestClient):
+    headers = auth_headers(register(client, "relevel@example.com"))
+    before = client.get("/me", headers=headers).json()
+    assert before["pet"]["level"] == 1
+
+    retuned = services.LevelTable([0, 5, 10, 15], {1: "egg", 2: "baby", 4: "adult"})
+    with SessionLocal() as db:
+        pets = db.query(Pet).count()
+        assert relevel_pets(db, retuned, chunk_size=3) == pets
+        assert relevel_pets(db, retuned, chunk_size=3) == 0
+
+    pet = client.get("/me", headers=headers).json()["pet"]
+    assert (pet["level"], pet["xp_current"], pet["stage"]) == (4, before["xp_total"] - 15, "adult")
+
+    with SessionLocal() as db:
+        assert relevel_pets(db) == pets
+    assert client.get("/me", headers=headers).json()["pet"] == before["pet"]
+
+
+def test_relevel_job_does_not_overwrite_a_concurrent_grant(client: TestClient):
+    headers = auth_headers(register(client, "relevel-race@example.com"))
+    with SessionLocal() as db:
+        user_id = db.query(Wallet.user_id).order_by(Wallet.user_id.desc()).limit(1).scalar()
+    granted = []
+
+    class GrantDuringRelevel(services.LevelTable):
+        def level(self, total_xp: int) -> tuple[int, int]:
+            if not granted:
+                with SessionLocal() as other:
+                    services.grant_reward(other, user_id, "bonus", 40, 0, "promo", "relevel-race")
+                    other.commit()
+                granted.append(True)
+            return super().level(total_xp)
+
+    with SessionLocal() as db:
+        relevel_pets(db, GrantDuringRelevel([0, 5, 10, 15], {1: "egg", 2: "baby", 4: "adult"}))
+
+    me = client.get("/me", headers=headers).json()
+    assert (me["pet"]["level"], me["pet"]["xp_current"]) == services.level_table.level(me["xp_total"])
+    assert settings.pet_relevel_on_start is False
+
+
+def test_hunger_decays_in_bulk_and_me_stays_read_only(client: TestClient):
+    headers = auth_headers(register(client, "hungry@example.com"))
+    other = auth_headers(register(client, "starving@example.com"))
+    now = datetime.now(UTC).replace(tzinfo=None)
+    with SessionLocal() as db:
+        hungry, starving = db.query(Pet).order_by(Pet.id.desc()).limit(2).all()[::-1]
+        hungry.hunger, hungry.last_hunger_tick = 80, now - timedelta(days=3)
+        starving.hunger, starving.last_hunger_tick = 50, now - timedelta(days=20)
+        db.commit()
+        hungry_id, starving_id = hungry.id, starving.id
+
+    with count_queries() as statements:
+        me = client.get("/me", headers=headers).json()
+    assert me["pet"]["hunger"] == 50
+    assert not [sql for sql in statements if sql.lstrip().upper().startswith(("UPDATE", "INSERT", "DELETE"))]
+    with SessionLocal() as db:
+        assert db.get(Pet, hungry_id).hunger == 80
+
+    with SessionLocal() as db:
+        assert decay_pet_hunger(db, now=now, chunk_size=2) >= 2
+        assert (db.get(Pet, hungry_id).hunger, db.get(Pet, starving_id).hunger) == (50, 0)
+        assert decay_pet_hunger(db, now=now, chunk_size=2) == 0
+    assert client.get("/me", headers=headers).json()["pet"]["hunger"] == 50
+    assert client.get("/pet", headers=other).json()["hunger"] == 0
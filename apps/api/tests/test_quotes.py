@@ -0,0 +1,246 @@
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+from threading import Thread
+from time import monotonic, sleep, time
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///./test_investipet.db")
+
+from app import services  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.models import Asset  # noqa: E402
+from app.quote_cache import QuoteCache, SQLiteQuoteStore  # noqa: E402
+from app.quote_client import CircuitBreaker, QuoteProviderClient  # noqa: E402
+
+
+def make_asset(symbol: str, asset_type: str = "stock", base_price: float = 100.0) -> Asset:
+    return Asset(symbol=symbol, name=symbol, type=asset_type, sector="Test", risk_class="low", base_price=base_price)
+
+
+def test_quotes_for_assets_fetches_misses_concurrently(monkeypatch):
+    monkeypatch.setattr(settings, "price_mode", "finnhub")
+    monkeypatch.setattr(settings, "finnhub_api_key", "test-key")
+
+    def slow_quote(symbol: str):
+        sleep(0.2)
+        return 42.0, time()
+
+    monkeypatch.setattr(services, "_fetch_finnhub_quote", slow_quote)
+    assets = [make_asset(f"S{i}") for i in range(6)]
+
+    started = monotonic()
+    quotes = services.quotes_for_assets(assets)
+    assert monotonic() - started < 0.6
+    assert {symbol: price for symbol, (price, _) in quotes.items()} == {asset.symbol: 42.0 for asset in assets}
+
+
+def test_quotes_for_assets_falls_back_after_shared_deadline(monkeypatch):
+    monkeypatch.setattr(settings, "price_mode", "hybrid")
+    monkeypatch.setattr(settings, "finnhub_api_key", "test-key")
+
+    def quote(symbol: str):
+        if symbol == "SLOW":
+            sleep(0.5)
+        return 42.0, time()
+
+    monkeypatch.setattr(services, "_fetch_finnhub_quote", quote)
+    slow = make_asset("SLOW", base_price=10.0)
+
+    started = monotonic()
+    quotes = services.quotes_for_assets([make_asset("FAST"), slow], deadline=monotonic() + 0.1)
+    assert monotonic() - started < 0.4
+    assert quotes["FAST"][0] == 42.0
+    assert quotes["SLOW"][0] == services._simulated_quote(slow)[0]
+
+
+class QuoteHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = json.dumps({"c": 123.45}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_provider_client_reuses_pooled_connections(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), QuoteHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(settings, "finnhub_base_url", f"http://127.0.0.1:{server.server_port}")
+
+    client = QuoteProviderClient()
+    try:
+        for _ in range(3):
+            assert client.get("/quote", params={"symbol": "AAPL"}).json()["c"] == 123.45
+        stats = client.stats()
+    finally:
+        client.close()
+        server.shutdown()
+
+    assert stats["requests"] == 3
+    assert stats["connections_opened"] == 1
+    assert stats["connections_reused"] == 2
+    assert stats["waiting"] == 0
+
+
+def test_refreshed_quotes_are_served_with_their_fetch_time(monkeypatch):
+    monkeypatch.setattr(settings, "price_mode", "finnhub")
+    monkeypatch.setattr(settings, "finnhub_api_key", "test-key")
+    monkeypatch.setattr(settings, "price_refresh_interval_seconds", 15)
+    fetched_at = time() - 10
+
+    def refresh(symbol: str):
+        services._quote_cache.put(symbol, (77.0, fetched_at))
+        return 77.0, fetched_at
+
+    monkeypatch.setattr(services, "_fetch_finnhub_quote", refresh)
+    asset = make_asset("REFR")
+    assert services.refresh_live_quotes([asset]) == 1
+
+    def no_network(symbol: str):
+        raise AssertionError("request path should not fetch")
+
+    monkeypatch.setattr(services, "_fetch_finnhub_quote", no_network)
+    price, as_of = services.quote_for_asset(asset)
+    assert price == 77.0
+    assert as_of == services._as_of(fetched_at)
+
+
+def test_concurrent_misses_share_one_fetch(monkeypatch):
+    monkeypatch.setattr(settings, "finnhub_api_key", "test-key")
+    calls = []
+
+    def fetch(symbol: str):
+        calls.append(symbol)
+        sleep(0.2)
+        return 55.0, time()
+
+    monkeypatch.setattr(services, "_fetch_finnhub_quote", fetch)
+    monkeypatch.setattr(services, "_quote_flight", services.SingleFlight())
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        results = list(pool.map(lambda _: services._quote_from_finnhub("HERD"), range(5)))
+
+    assert calls == ["HERD"]
+    assert all(result[0] == 55.0 for result in results)
+    assert services.quote_fetch_stats()["deduplicated"] == 4
+
+
+def test_shared_store_fills_the_local_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "finnhub_api_key", "test-key")
+    worker_a = SQLiteQuoteStore(str(tmp_path / "quotes.db"))
+    worker_b = SQLiteQuoteStore(str(tmp_path / "quotes.db"))
+    worker_a.put("SHRD", 12.5, time())
+    worker_a.put("SHRD", 11.0, time() - 600)
+
+    monkeypatch.setattr(services, "_shared_quotes", worker_b)
+    monkeypatch.setattr(services, "_fetch_finnhub_quote", lambda symbol: None)
+
+    assert services._quote_from_finnhub("SHRD")[0] == 12.5
+    assert services._quote_cache.peek("SHRD")[0] == 12.5
+
+
+def test_stale_quote_is_served_while_one_refresh_runs(monkeypatch):
+    monkeypatch.setattr(settings, "finnhub_api_key", "test-key")
+    services._quote_cache.put("SWR", (30.0, time() - settings.price_cache_ttl_seconds - 1))
+    calls = []
+
+    def fetch(symbol: str):
+        calls.append(symbol)
+        sleep(0.1)
+        quote = (31.0, time())
+        services._quote_cache.put(symbol, quote)
+        return quote
+
+    monkeypatch.setattr(services, "_fetch_finnhub_quote", fetch)
+    assert services._quote_from_finnhub("SWR")[0] == 30.0
+    assert services._quote_from_finnhub("SWR")[0] == 30.0
+    sleep(0.3)
+    assert calls == ["SWR"]
+    assert services._quote_from_finnhub("SWR")[0] == 31.0
+
+
+def test_failing_symbol_backs_off_instead_of_retrying(monkeypatch):
+    monkeypatch.setattr(settings, "finnhub_api_key", "test-key")
+    calls = []
+
+    def failing(symbol: str):
+        calls.append(symbol)
+        services._quote_cache.record_failure(symbol)
+        return None
+
+    monkeypatch.setattr(services, "_fetch_finnhub_quote", failing)
+    before = services.quote_cache_stats()["negative"]
+    assert services._quote_from_finnhub("DOWN") is None
+    assert services._quote_from_finnhub("DOWN") is None
+    assert calls == ["DOWN"]
+    assert services.quote_cache_stats()["negative"] == before + 1
+
+    services._quote_cache.put("FLAKY", (50.0, time() - 60))
+    monkeypatch.setattr(settings, "price_cache_ttl_seconds", 30)
+    monkeypatch.setattr(settings, "price_max_staleness_seconds", 600)
+    for _ in range(5):
+        assert services._quote_from_finnhub("FLAKY")[0] == 50.0
+        sleep(0.05)
+    assert calls == ["DOWN", "FLAKY"]
+    assert services._quote_cache.is_suppressed("FLAKY")
+
+
+def test_quote_cache_evicts_least_recently_used():
+    cache = QuoteCache(max_entries=2, backoff_seconds=1, max_backoff_seconds=1)
+    cache.put("A", (1.0, time()))
+    cache.put("B", (2.0, time()))
+    cache.lookup("A", 60, 120)
+    cache.put("C", (3.0, time()))
+    assert cache.peek("B") is None
+    assert cache.peek("A") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_circuit_breaker_trips_and_half_opens():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.1)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    sleep(0.15)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow()
+    assert breaker.stats()["trips"] == 1
+
+
+def test_spent_budget_skips_the_provider(monkeypatch):
+    monkeypatch.setattr(settings, "price_mode", "hybrid")
+    monkeypatch.setattr(settings, "finnhub_api_key", "test-key")
+
+    def no_network(symbol: str):
+        raise AssertionError("spent budget should not fetch")
+
+    monkeypatch.setattr(services, "_fetch_finnhub_quote", no_network)
+    asset = make_asset("BUDGET")
+    price, _ = services.quote_for_asset(asset, deadline=monotonic() - 1)
+    assert price == services._simulated_quote(asset)[0]
+
+
+def test_simulated_prices_are_memoized_per_minute(monkeypatch):
+    monkeypatch.setattr(settings, "price_mode", "simulated")
+    assets = [make_asset("MEMA", base_price=50.0), make_asset("MEMB", base_price=80.0)]
+    now = services.datetime(2026, 1, 2, 3, 4, 5, tzinfo=services.timezone.utc)
+
+    quotes = services.quotes_for_assets(assets)
+    assert len({as_of for _, as_of in quotes.values()}) == 1
+
+    first = services._simulated_prices(assets, now)
+    digests = []
+    monkeypatch.setattr(services.hashlib, "sha256", lambda data: digests.append(data))
+    assert services._simulated_prices(assets, now.replace(second=59)) == first
+    assert digests == []